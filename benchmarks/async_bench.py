@@ -0,0 +1,79 @@
+"""Compare concurrent command throughput of the sync and asyncio execution modes.
+
+Both modes run the real callbacks against a fake CardaBot API (local HTTP server)
+and fake Telegram replies. The sync mode runs callbacks on a thread pool like the
+`run_async` dispatcher workers; the async mode schedules them on the event loop.
+Run from the repository root:
+
+    python -m benchmarks.async_bench --commands 500 --workers 4
+
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from benchmarks.fakes import FakeAPI, FakeTelegram
+
+
+def run_sync(cbs, telegram, command, chat_ids, workers) -> float:
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for chat_id in chat_ids:
+            update = telegram.update(chat_id, f"/{command}")
+            pool.submit(getattr(cbs, command), update, telegram.context())
+    return time.monotonic() - start
+
+
+def run_async(cbs, telegram, command, chat_ids) -> float:
+    start = time.monotonic()
+    futures = []
+    for chat_id in chat_ids:
+        update = telegram.update(chat_id, f"/{command}")
+        futures.append(getattr(cbs, command)(update, telegram.context()))
+    wait(futures)
+    return time.monotonic() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commands", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4, help="sync BOT_WORKERS")
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    fake_api = FakeAPI(args.api_latency).start()
+    os.environ.update(
+        CARDABOT_API_URL=fake_api.url,
+        CARDABOT_API_TOKEN="benchmark",
+        BOT_WORKERS=str(args.workers),
+    )
+
+    from cardabot_telegram import aio_callbacks, callbacks
+
+    modes = {
+        "sync": callbacks.CardaBotCallbacks(),
+        "async": aio_callbacks.AsyncCardaBotCallbacks(),
+    }
+    for command in ("balance", "epoch_info"):
+        for mode, cbs in modes.items():
+            fake_api.reset()
+            telegram = FakeTelegram(args.telegram_latency)
+            # distinct chats per run, so chat settings are fetched from the API
+            offset = 1_000_000 * (len(mode) + 10 * len(command))
+            chat_ids = range(offset, offset + args.commands)
+            if mode == "sync":
+                elapsed = run_sync(cbs, telegram, command, chat_ids, args.workers)
+            else:
+                elapsed = run_async(cbs, telegram, command, chat_ids)
+
+            calls = sum(fake_api.calls.values())
+            print(
+                f"{command:10} {mode:5}: {args.commands / elapsed:8.1f} commands/s "
+                f"({calls / args.commands:.1f} API calls/command, "
+                f"{telegram.replies} replies)"
+            )
+
+    modes["async"].runtime.run(modes["async"].aapi.close())
+    fake_api.stop()
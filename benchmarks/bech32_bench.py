@@ -0,0 +1,54 @@
+"""Compare the native bech32 codec with the legacy `bin/bech32` subprocess call.
+
+Run from the repository root:
+
+    python -m benchmarks.bech32_bench [-n 200]
+
+"""
+import argparse
+import os
+import subprocess
+import timeit
+
+from cardabot_telegram import bech32, utils
+
+POOL_ID = "pool1ndtsklata6rphamr6jw2p3ltnzayq3pezhg0djvn7n5js8rqlzh"
+
+
+def subprocess_bech32_to_hex(pool_bech32: str) -> str:
+    """Previous implementation, shelling out to the bech32 binary."""
+    cmd = "{}/bin/bech32 <<< {}".format(os.getcwd(), pool_bech32)
+    process = subprocess.run(
+        cmd, shell=True, executable="/bin/bash", capture_output=True
+    )
+    return process.stdout.strip().decode()
+
+
+def report(name: str, number: int, seconds: float) -> None:
+    print(f"{name:<24} {number:>8} calls  {seconds / number * 1e6:>12.2f} us/call")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=200, help="subprocess iterations")
+    args = parser.parse_args()
+
+    # batch of distinct pool ids, so the memoized path is measured cold and warm
+    pool_ids = bech32.hex_to_pool_ids(f"{i:056x}" for i in range(1, 1001))
+
+    if os.path.exists("bin/bech32"):
+        assert subprocess_bech32_to_hex(POOL_ID) == bech32.pool_id_to_hex(POOL_ID)
+        t = timeit.timeit(lambda: subprocess_bech32_to_hex(POOL_ID), number=args.n)
+        report("subprocess", args.n, t)
+    else:
+        print("bin/bech32 not found, skipping subprocess benchmark")
+
+    n = len(pool_ids)
+    t = timeit.timeit(lambda: bech32.pool_ids_to_hex(pool_ids), number=1)
+    report("native (batch)", n, t)
+
+    utils.bech32_to_hex.cache_clear()
+    t = timeit.timeit(lambda: [utils.bech32_to_hex(p) for p in pool_ids], number=1)
+    report("memoized (cold)", n, t)
+    t = timeit.timeit(lambda: [utils.bech32_to_hex(p) for p in pool_ids], number=10)
+    report("memoized (warm)", n * 10, t)
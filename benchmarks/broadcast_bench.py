@@ -0,0 +1,42 @@
+"""Measure broadcast throughput offline, using a fake Telegram bot.
+
+Compares the previous serial loop with the concurrent, rate-limited broadcaster.
+Run from the repository root:
+
+    python -m benchmarks.broadcast_bench --chats 2000 --rate 30 --workers 8
+
+"""
+import argparse
+import time
+
+from cardabot_telegram import broadcast
+
+
+def serial_send(bot, chat_ids) -> float:
+    """Previous implementation: one blocking send per chat, in order."""
+    start = time.monotonic()
+    for chat_id in chat_ids:
+        bot.send_message(chat_id=chat_id, text="benchmark")
+    return time.monotonic() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=30, help="global msgs/s")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="send latency")
+    parser.add_argument("--blocked", type=float, default=0.05, help="blocked ratio")
+    parser.add_argument("--serial", type=int, default=200, help="serial sample size")
+    args = parser.parse_args()
+
+    chat_ids = list(range(1, args.chats + 1))
+
+    elapsed = serial_send(broadcast.FakeBot(args.latency), chat_ids[: args.serial])
+    print(f"serial:      {args.serial / elapsed:8.1f} msgs/s")
+
+    bot = broadcast.FakeBot(args.latency, blocked_ratio=args.blocked)
+    limiter = broadcast.TelegramRateLimiter(global_rate=args.rate)
+    broadcaster = broadcast.Broadcaster(bot, workers=args.workers, limiter=limiter)
+    report = broadcaster.send(chat_ids, "benchmark")
+    print(f"broadcaster: {report.total / report.elapsed:8.1f} msgs/s ({report})")
@@ -0,0 +1,234 @@
+"""Offline stand-ins for the CardaBot API and Telegram, used by the benchmarks."""
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+POOL_ID = "pool1ndtsklata6rphamr6jw2p3ltnzayq3pezhg0djvn7n5js8rqlzh"
+STAKE_KEY = "stake1uxpdrerp9wrxunfh6ukyv5267j70fzxgw0fr3z8zeac5vyqhf9jhy"
+BOT_TOKEN = "123456:BENCHMARK"
+
+# fmt: off
+EPOCH = {
+    "percentage": 42, "current_epoch": 300, "current_slot": 1, "slot_in_epoch": 1,
+    "txs_in_epoch": 1, "fees_in_epoch": 1, "active_stake": 1,
+    "n_active_stake_pools": 1, "remaining_time": 3600,
+}
+POTS = {"treasury": 1, "reserves": 1, "fees": 1, "rewards": 1, "utxo": 1, "deposits": 1}
+NETPARAMS = {
+    "a0": 0.3, "min_pool_cost": 340, "min_utxo_value": 1, "n_opt": 500, "rho": 0,
+    "tau": 0,
+}
+NETSTATS = {
+    "ada_in_circulation": 1, "percentage_in_stake": 1, "stakepools": 1,
+    "delegations": 1, "load_15m": 1, "load_1h": 1, "load_24h": 1,
+}
+POOL = {
+    "ticker": "EBS", "name": "EveryBlock Studio", "description": "", "homepage": "",
+    "pool_id": POOL_ID, "pledge": 1, "fixed_cost": 340, "margin": 0.01,
+    "saturation": 0.5, "controlled_stake_percentage": 0.1, "active_stake_amount": 1,
+    "delegators_count": 1, "epoch_blocks_count": 1, "lifetime_blocks_count": 1,
+}
+EPOCH_SUMMARY = {
+    "epoch": 300, "blocks": 1, "txs": 1, "fees": 1, "reserves": 1, "treasury": 1,
+}
+# fmt: on
+
+
+def _chat(chat_id) -> dict:
+    return {
+        "chat_id": str(chat_id),
+        "default_language": "EN",
+        "default_pool_id": POOL_ID,
+        "cardabot_user_id": 1,
+    }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class FakeServer:
+    """Threaded JSON HTTP server answering every request after a fixed latency.
+
+    Subclasses implement `handle(method, path, body)`, returning a status code and a
+    JSON payload. Requests are counted per route in `calls`.
+
+    """
+
+    def __init__(self, latency: float = 0.05) -> None:
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _answer(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                time.sleep(fake.latency)
+                status, payload = fake.handle(
+                    self.command, urlsplit(self.path).path, body
+                )
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = _answer
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _Server(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def count(self, route: str) -> None:
+        with self._lock:
+            self.calls[route] += 1
+
+    def handle(self, method: str, path: str, body: bytes) -> tuple[int, object]:
+        raise NotImplementedError
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls.clear()
+
+
+class FakeAPI(FakeServer):
+    """Stub of the CardaBot REST API, serving the routes used by the callbacks."""
+
+    def __init__(self, latency: float = 0.05, chats: int = 100) -> None:
+        super().__init__(latency)
+        self.url = self.base_url + "api/"
+        self.chats = chats
+        self._tx_ids = itertools.count(1)
+        # (method, route, status, payload or payload(match))
+        self.routes = [
+            ("GET", r"epoch/", 200, {"data": EPOCH}),
+            ("GET", r"pots/", 200, {"data": POTS}),
+            ("GET", r"netparams/", 200, {"data": NETPARAMS}),
+            ("GET", r"netstats/", 200, {"data": NETSTATS}),
+            ("GET", r"epochsummary/", 200, {"data": EPOCH_SUMMARY}),
+            ("GET", r"pool/[^/]+", 200, {"data": POOL}),
+            ("GET", r"chats/", 200, self._chat_list),
+            ("POST", r"chats/", 201, lambda m: _chat(0)),
+            ("GET", r"chats/(-?\d+)/token/", 200, {"tmp_token": "benchmark"}),
+            ("GET", r"chats/(-?\d+)/balance/", 200, self._balance),
+            ("GET", r"chats/(-?\d+)/", 200, lambda m: _chat(m.group(1))),
+            ("PATCH", r"chats/(-?\d+)/", 200, lambda m: _chat(m.group(1))),
+            ("GET", r"users/(\d+)/", 200, {"stake_key": STAKE_KEY}),
+            ("POST", r"unsignedtx/", 201, self._new_tx),
+            ("GET", r"checktx/([^/]+)/", 200, {}),
+            ("POST", r"claim/", 200, self._new_tx),
+        ]
+
+    def _chat_list(self, match) -> list:
+        return [_chat(chat_id) for chat_id in range(1, self.chats + 1)]
+
+    def _balance(self, match) -> dict:
+        return {"controlled_amount": 10, "claimable_amount": 0}
+
+    def _new_tx(self, match) -> dict:
+        return {"tx_id": f"tx{next(self._tx_ids)}"}
+
+    def handle(self, method, path, body):
+        path = path.split("/api/", 1)[-1]
+        for route_method, route, status, payload in self.routes:
+            match = re.fullmatch(route, path)
+            if match and method == route_method:
+                self.count(f"{method} {route}")
+                return status, payload(match) if callable(payload) else payload
+        return 404, {"detail": "Not found."}
+
+
+class FakeBotAPI(FakeServer):
+    """Stub of the Telegram Bot API, for a real `telegram.Bot`.
+
+    Use `bot_kwargs()` to point a bot at it:
+
+        bot = telegram.Bot(**FakeBotAPI().start().bot_kwargs())
+
+    """
+
+    def __init__(self, latency: float = 0.05) -> None:
+        super().__init__(latency)
+        self._message_ids = itertools.count(1)
+
+    def bot_kwargs(self) -> dict:
+        return {"token": BOT_TOKEN, "base_url": self.base_url + "bot"}
+
+    def handle(self, method, path, body):
+        api_method = path.rsplit("/", 1)[-1]
+        self.count(api_method)
+        params = json.loads(body) if body else {}
+        if api_method == "getMe":
+            user = {"id": 123456, "is_bot": True, "first_name": "CardaBot"}
+            return 200, {"ok": True, "result": {**user, "username": "cardabot"}}
+        if api_method == "getChatAdministrators":
+            return 200, {"ok": True, "result": []}
+
+        chat_id = int(params.get("chat_id", 1))
+        message = {
+            "message_id": params.get("message_id") or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }
+        return 200, {"ok": True, "result": message}
+
+
+class FakeTelegram:
+    """Records the replies of fake updates, each taking `latency` seconds.
+
+    Lighter than `FakeBotAPI`: the callbacks are called directly, without a bot.
+
+    """
+
+    def __init__(self, latency: float = 0.05) -> None:
+        self.latency = latency
+        self.replies = 0
+        self._update_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _reply(self, *args, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.replies += 1
+        return SimpleNamespace(edit_text=self._reply)
+
+    def update(self, chat_id: int, text: str) -> SimpleNamespace:
+        """Return a minimal private chat update, as seen by the callbacks."""
+        user = SimpleNamespace(id=chat_id, username=f"user{chat_id}")
+        message = SimpleNamespace(
+            text=text,
+            from_user=user,
+            reply_to_message=None,
+            reply_html=self._reply,
+            reply_text=self._reply,
+        )
+        return SimpleNamespace(
+            update_id=next(self._update_ids),
+            effective_chat=SimpleNamespace(id=chat_id, type="private"),
+            effective_user=user,
+            message=message,
+        )
+
+    def context(self, args: list[str] | None = None) -> SimpleNamespace:
+        bot = SimpleNamespace(send_message=self._reply)
+        return SimpleNamespace(args=args or [], bot=bot)
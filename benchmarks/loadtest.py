@@ -0,0 +1,243 @@
+"""Load-test the bot offline: real callbacks and dispatcher, fake API and Telegram.
+
+Stands up a stub of the CardaBot REST API and of the Telegram Bot API, registers
+the real `CardaBotCallbacks` on a python-telegram-bot `Dispatcher` (pointed at the
+fake Telegram) and feeds it command updates, keeping `--concurrency` of them in
+flight. Reports throughput, p50/p95/p99 latency (from enqueueing the update until
+the callback is done) and CardaBot API calls per command. Run from the repository
+root:
+
+    python -m benchmarks.loadtest --commands 1000 --concurrency 50
+    python -m benchmarks.loadtest --mix epoch=5,pool=2,tip=1 --async-mode
+
+"""
+import argparse
+import contextvars
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import Future
+from queue import Queue
+
+from telegram import Update
+from telegram.ext import Dispatcher
+from telegram.utils.request import Request
+
+from benchmarks.fakes import FakeAPI, FakeBotAPI
+
+DEFAULT_MIX = "epoch=4,pool=2,pots=1,netparams=1,netstats=1,help=1,balance=1,tip=1"
+
+# message text sent for each command (default: "/<command>")
+COMMAND_TEXT = {"tip": "/tip 5", "language": "/language EN"}
+
+current_command = contextvars.ContextVar("current_command", default="background")
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """Parse "epoch=4,pool=2" into command weights."""
+    weights = {}
+    for item in mix.split(","):
+        command, _, weight = item.partition("=")
+        weights[command.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def make_update(bot, update_id: int, chat_id: int, text: str) -> Update:
+    user = {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": user,
+        "text": text,
+        "entities": [
+            {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+        ],
+    }
+    if text.startswith("/tip"):
+        receiver = {"id": chat_id + 1, "is_bot": False, "first_name": "receiver"}
+        message["reply_to_message"] = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": message["chat"],
+            "from": {**receiver, "username": "receiver"},
+            "text": "gm",
+        }
+    return Update.de_json({"update_id": update_id, "message": message}, bot)
+
+
+class Recorder:
+    """Times commands and counts the API calls made on their behalf."""
+
+    def __init__(self, concurrency: int) -> None:
+        self.slots = threading.Semaphore(concurrency)
+        self.started: dict[int, float] = {}
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.api_calls = Counter()
+        self._lock = threading.Lock()
+
+    def wrap(self, command: str, callback):
+        """Wrap a dispatcher callback (see `handlers.register`)."""
+
+        def timed(update, context):
+            token = current_command.set(command)
+            try:
+                result = callback(update, context)
+            except BaseException:
+                self._done(command, update)
+                raise
+            finally:
+                current_command.reset(token)
+
+            if isinstance(result, Future):  # async mode: wait for the coroutine
+                result.add_done_callback(lambda f: self._done(command, update))
+            else:
+                self._done(command, update)
+            return result
+
+        return timed
+
+    def _done(self, command: str, update: Update) -> None:
+        elapsed = time.perf_counter() - self.started.pop(update.update_id)
+        with self._lock:
+            self.latencies[command].append(elapsed)
+        self.slots.release()
+
+    def count_api_calls(self, client) -> None:
+        """Count the requests made through a (sync or async) API client."""
+        request = client.request
+
+        def count():
+            with self._lock:
+                self.api_calls[current_command.get()] += 1
+
+        if hasattr(client, "session"):  # api.CardabotAPI
+
+            def counted(*args, **kwargs):
+                count()
+                return request(*args, **kwargs)
+
+        else:  # aio.AsyncCardabotAPI
+
+            async def counted(*args, **kwargs):
+                count()
+                return await request(*args, **kwargs)
+
+        client.request = counted
+
+
+def print_breakdown(metrics) -> None:
+    """Print where the time of each command went, from the bot's own metrics."""
+    header = ("wall ms", "api ms", "tg ms", "render ms", "hits")
+    print(f"{'callback':20} " + " ".join(f"{h:>9}" for h in header))
+    histograms = (
+        metrics.COMMAND_SECONDS,
+        metrics.COMMAND_API_SECONDS,
+        metrics.COMMAND_TELEGRAM_SECONDS,
+        metrics.COMMAND_RENDER_SECONDS,
+    )
+    for name in sorted(metrics.COMMAND_SECONDS.names()):
+        count = metrics.COMMAND_SECONDS.count(name)
+        means = [1000 * h.sum(name) / count for h in histograms]
+        hits = metrics.COMMAND_CACHE_HITS.value(name) / count
+        print(f"{name:20} " + " ".join(f"{v:9.1f}" for v in (*means, hits)))
+
+
+def main(args) -> None:
+    fake_api = FakeAPI(args.api_latency).start()
+    fake_telegram = FakeBotAPI(args.telegram_latency).start()
+    os.environ.update(
+        CARDABOT_API_URL=fake_api.url,
+        CARDABOT_API_TOKEN="benchmark",
+        BOT_WORKERS=str(args.workers),
+        CARDABOT_DB_PATH=os.path.join(tempfile.mkdtemp(), "loadtest.sqlite3"),
+    )
+
+    from cardabot_telegram import handlers, metrics, utils
+
+    recorder = Recorder(args.concurrency)
+    if args.async_mode:
+        from cardabot_telegram import aio_callbacks
+
+        cbs = aio_callbacks.AsyncCardaBotCallbacks()
+        async_commands = aio_callbacks.ASYNC_COMMANDS
+        recorder.count_api_calls(cbs.aapi)
+    else:
+        from cardabot_telegram import callbacks
+
+        cbs = callbacks.CardaBotCallbacks()
+        async_commands = frozenset()
+    recorder.count_api_calls(cbs.api)
+
+    request = Request(con_pool_size=args.workers + 32)
+    bot = metrics.InstrumentedBot(**fake_telegram.bot_kwargs(), request=request)
+    dispatcher = Dispatcher(bot, Queue(), workers=args.workers, use_context=True)
+    handlers.register(dispatcher, cbs, async_commands, wrap=recorder.wrap)
+    threading.Thread(target=dispatcher.start, daemon=True).start()
+    bot.get_me()  # cache the bot user, as the updater does on startup
+    fake_telegram.reset()
+
+    weights = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    commands = rng.choices(list(weights), list(weights.values()), k=args.commands)
+
+    start = time.perf_counter()
+    for update_id, command in enumerate(commands, 1):
+        recorder.slots.acquire()
+        chat_id = rng.randrange(1, args.chats + 1) * 2  # receivers of tips are odd
+        text = COMMAND_TEXT.get(command, f"/{command}")
+        update = make_update(bot, update_id, chat_id, text)
+        recorder.started[update_id] = time.perf_counter()
+        dispatcher.update_queue.put(update)
+
+    for _ in range(args.concurrency):  # wait for the commands still in flight
+        recorder.slots.acquire()
+    elapsed = time.perf_counter() - start
+
+    mode = "async" if args.async_mode else "sync"
+    print(
+        f"{args.commands} commands in {elapsed:.2f}s ({mode} mode, "
+        f"{args.workers} workers, concurrency {args.concurrency}): "
+        f"{args.commands / elapsed:.1f} commands/s"
+    )
+    header = ("count", "p50 ms", "p95 ms", "p99 ms", "api/cmd")
+    print(f"{'command':10} " + " ".join(f"{h:>8}" for h in header))
+    for command, latencies in sorted(recorder.latencies.items()):
+        p50, p95, p99 = (1000 * percentile(latencies, p) for p in (50, 95, 99))
+        calls = recorder.api_calls[command] / len(latencies)
+        print(
+            f"{command:10} {len(latencies):8} {p50:8.1f} {p95:8.1f} {p99:8.1f} "
+            f"{calls:8.2f}"
+        )
+    print(f"background API calls: {recorder.api_calls['background']}")
+    print_breakdown(metrics)
+    print(f"telegram calls: {dict(fake_telegram.calls)}")
+
+    # stop background checks (e.g. of tips); the fakes keep serving until exit
+    utils.get_scheduler().shutdown(wait=False)
+    dispatcher.stop()
+    if args.async_mode:
+        cbs.runtime.run(cbs.aapi.close())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commands", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50, help="in flight")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="command=weight,...")
+    parser.add_argument("--workers", type=int, default=4, help="BOT_WORKERS")
+    parser.add_argument("--chats", type=int, default=500, help="distinct chats")
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--async-mode", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,69 @@
+"""Measure the cold import time of the bot, as in `python -X importtime`.
+
+Each run imports the bot modules in a fresh interpreter with `-X importtime`, and
+reports the median wall time of the import, the modules taking the longest to load
+(cumulative, including their own imports) and whether importing started threads,
+which it shouldn't. Run from the repository root:
+
+    python -m benchmarks.startup_bench [-n 5] [--top 15] [--module cardabot_telegram.app]
+
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# run in the child interpreter: import, then print the wall time and thread count
+CHILD = """
+import threading, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, threading.active_count())
+"""
+
+
+def parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    """Return module -> (self us, cumulative us) from an `-X importtime` report."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header
+        times[module.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def run(module: str) -> tuple[float, int, dict[str, tuple[int, int]]]:
+    """Import `module` in a fresh interpreter; return (seconds, threads, times)."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    seconds, threads = process.stdout.split()
+    return float(seconds), int(threads), parse_importtime(process.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=5, help="fresh interpreters")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules shown")
+    parser.add_argument("--module", default="cardabot_telegram.app")
+    args = parser.parse_args()
+
+    runs = [run(args.module) for _ in range(args.n)]
+    seconds = [run_seconds for run_seconds, _, _ in runs]
+    _, threads, times = runs[-1]
+
+    print(
+        f"import {args.module}: median {1000 * statistics.median(seconds):.1f} ms, "
+        f"min {1000 * min(seconds):.1f} ms over {args.n} runs, "
+        f"{len(times)} modules, {threads} thread(s) after import"
+    )
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    slowest = sorted(times.items(), key=lambda item: item[1][1], reverse=True)
+    for module, (self_us, cumulative_us) in slowest[: args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:8.1f}  {module}")
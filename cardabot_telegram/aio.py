@@ -0,0 +1,225 @@
+"""Asyncio execution mode: event loop runtime and non-blocking CardaBot API client.
+
+Requires `aiohttp`, which is only imported when the async mode is enabled.
+
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections.abc import AsyncIterator, Coroutine, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import aiohttp
+import requests
+
+from . import api, metrics, tracing
+
+
+async def _in_context(context: contextvars.Context, coro: Coroutine):
+    # tasks start from a copy of the loop thread's context, restore the caller's
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+class EventLoopThread:
+    """An asyncio event loop running in a background thread.
+
+    Synchronous code (e.g. python-telegram-bot handlers) hands coroutines over with
+    `submit` and returns right away. Blocking calls that have no asyncio version,
+    such as Telegram sends through `telegram.Bot`, are run from the loop with
+    `run_blocking` on a bounded thread pool.
+
+    """
+
+    def __init__(self, blocking_workers: int | None = None) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(
+            max_workers=blocking_workers
+            or int(os.environ.get("ASYNC_BLOCKING_WORKERS", 16)),
+            thread_name_prefix="aio-blocking",
+        )
+        self.loop.set_default_executor(self.executor)
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="aio-loop", daemon=True
+        )
+
+    def start(self) -> "EventLoopThread":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.executor.shutdown(wait=False)
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedule a coroutine on the loop from any thread, in the caller's context."""
+        context = contextvars.copy_context()
+        return asyncio.run_coroutine_threadsafe(_in_context(context, coro), self.loop)
+
+    def run(self, coro: Coroutine, timeout: float | None = None):
+        """Run a coroutine on the loop and wait for its result (not from the loop)."""
+        return self.submit(coro).result(timeout)
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """Run a blocking call on the thread pool without blocking the loop."""
+        call = functools.partial(func, *args, **kwargs)
+        context = contextvars.copy_context()
+        return await self.loop.run_in_executor(self.executor, context.run, call)
+
+    def iterate(self, aiterator: AsyncIterator) -> Iterator:
+        """Consume an async iterator from synchronous code (not from the loop)."""
+        while True:
+            try:
+                yield self.run(aiterator.__anext__())
+            except StopAsyncIteration:
+                return
+
+
+class AsyncResponse:
+    """Minimal response object mirroring the parts of `requests.Response` we use."""
+
+    def __init__(self, status_code: int, body: bytes, url: str) -> None:
+        self.status_code = status_code
+        self.content = body
+        self.url = url
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+
+class AsyncResponseCache(api.ResponseCache):
+    """`api.ResponseCache` for coroutines: concurrent misses await a single load."""
+
+    async def aget(self, endpoint: str, params: dict | None, loader) -> dict:
+        loop = asyncio.get_running_loop()
+        key, payload, future, leader = self._claim(endpoint, params, loop.create_future)
+        if payload is not None:
+            return payload
+        if not leader:
+            return await asyncio.shield(future)
+
+        try:
+            payload = await loader()
+        except BaseException as e:
+            self._discard(key)
+            future.set_exception(e)
+            future.exception()  # mark as retrieved, the error is raised below
+            raise
+
+        self._store(endpoint, key, payload)
+        future.set_result(payload)
+        return payload
+
+
+class AsyncCardabotAPI:
+    """Non-blocking counterpart of `api.CardabotAPI`, based on `aiohttp`.
+
+    Must be used from a single event loop. The HTTP session is created lazily on the
+    first request, inside that loop.
+
+    """
+
+    retry_statuses = (502, 503, 504)
+
+    def __init__(
+        self,
+        url: str,
+        token: str | None = None,
+        pool_size: int | None = None,
+        connect_timeout: float | None = None,
+        read_timeout: float | None = None,
+        retries: int = 3,
+        backoff_factor: float = 0.3,
+    ) -> None:
+        self.base_url = url
+        token = token or os.environ.get("CARDABOT_API_TOKEN")
+        self.headers = {"Authorization": "Token " + token}
+        self.pool_size = pool_size or int(
+            api._env_number("CARDABOT_API_ASYNC_POOL", 64)
+        )
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout
+            or api._env_number("CARDABOT_API_CONNECT_TIMEOUT", 3.05),
+            sock_read=read_timeout or api._env_number("CARDABOT_API_READ_TIMEOUT", 15),
+        )
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.cache = AsyncResponseCache()
+        self._session = None
+
+    def url(self, endpoint: str) -> str:
+        """Return the absolute URL for an API endpoint."""
+        return os.path.join(self.base_url, endpoint)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def request(self, method: str, endpoint: str, **kwargs) -> AsyncResponse:
+        """Send a request; GETs are retried with backoff like in `CardabotAPI`."""
+        start = time.perf_counter()
+        with tracing.span("api", method=method, endpoint=endpoint) as span:
+            try:
+                r = await self._request(method, self.url(endpoint), **kwargs)
+            finally:
+                metrics.record_api(method, time.perf_counter() - start)
+            span.set(status=r.status_code)
+            return r
+
+    async def _request(self, method: str, url: str, **kwargs) -> AsyncResponse:
+        attempts = self.retries + 1 if method == "GET" else 1
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                async with self._get_session().request(method, url, **kwargs) as r:
+                    body = await r.read()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if last_attempt:
+                    raise
+            else:
+                if r.status not in self.retry_statuses or last_attempt:
+                    return AsyncResponse(r.status, body, str(r.url))
+
+            await asyncio.sleep(self.backoff_factor * 2 ** attempt)
+
+    async def get(self, endpoint: str, **kwargs) -> AsyncResponse:
+        return await self.request("GET", endpoint, **kwargs)
+
+    async def post(self, endpoint: str, **kwargs) -> AsyncResponse:
+        return await self.request("POST", endpoint, **kwargs)
+
+    async def patch(self, endpoint: str, **kwargs) -> AsyncResponse:
+        return await self.request("PATCH", endpoint, **kwargs)
+
+    async def get_cached(self, endpoint: str, params: dict | None = None) -> dict:
+        """GET a network-wide endpoint through the shared response cache."""
+
+        async def load():
+            r = await self.get(endpoint, params=params)
+            r.raise_for_status()
+            return r.json()
+
+        return await self.cache.aget(endpoint, params, load)
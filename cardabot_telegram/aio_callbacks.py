@@ -0,0 +1,205 @@
+"""Bot callbacks for the asyncio execution mode.
+
+Read-only and chat settings commands run as coroutines on one event loop and use the
+non-blocking CardaBot API client. Their handlers only schedule the coroutine, so the
+dispatcher never waits on the API. python-telegram-bot 13 has no asyncio `Bot`, so
+Telegram calls are run on the runtime's bounded thread pool.
+
+The remaining commands (/tip, /connect, /claim, /alert, ...) keep their thread-based
+implementation from `CardaBotCallbacks`.
+
+"""
+import asyncio
+import functools
+import logging
+from collections.abc import Iterator
+
+from . import aio, database, utils
+from .callbacks import CardaBotCallbacks, instrument
+from .replies import HTMLReplies, get_replies
+
+# commands implemented as coroutines, registered without `run_async`
+ASYNC_COMMANDS = frozenset(
+    {
+        "help",
+        "start",
+        "change_language",
+        "change_default_pool",
+        "epoch_info",
+        "pool_info",
+        "pots",
+        "netparams",
+        "netstats",
+        "balance",
+    }
+)
+
+
+class AsyncCardaBotCallbacks(CardaBotCallbacks):
+    def __init__(self, runtime: aio.EventLoopThread | None = None) -> None:
+        super().__init__()
+        self.runtime = runtime or aio.EventLoopThread().start()
+        self.aapi = aio.AsyncCardabotAPI(self.base_url)
+        # share the chat cache with the sync commands
+        self.adb = database.AsyncCardabotDB(self.aapi, cache=self.cardabotdb.cache)
+
+    async def _telegram(self, func, *args, **kwargs):
+        """Call a blocking Telegram method without blocking the event loop."""
+        return await self.runtime.run_blocking(func, *args, **kwargs)
+
+    async def _reply_html(self, update, text: str):
+        return await self._telegram(update.message.reply_html, text)
+
+    async def _run_callback(self, func, update, context):
+        with instrument(func.__name__, update) as stats:
+            chat_id = update.effective_chat.id
+            try:
+                language = await self.adb.get_chat_language(chat_id)
+                html = get_replies(language)
+                await func(self, update, context, html)
+                logging.debug("Chat cache stats: %s", self.adb.cache_stats())
+
+            except Exception as e:
+                await self._telegram(self._inform_error, context, chat_id)
+                logging.exception(e)
+                stats.failed = True
+
+    def _setup_async_callback(func):
+        """Decorator turning a coroutine into a handler that schedules it."""
+
+        @functools.wraps(func)
+        def callback(self, update, context):
+            return self.runtime.submit(self._run_callback(func, update, context))
+
+        return callback
+
+    async def _send_help(self, update, html: HTMLReplies) -> None:
+        await self._reply_html(
+            update,
+            html.reply("help.html", supported_languages=html.supported_languages),
+        )
+
+    @_setup_async_callback
+    async def help(self, update, context, html: HTMLReplies) -> None:
+        await self._send_help(update, html)
+
+    @_setup_async_callback
+    async def start(self, update, context, html: HTMLReplies) -> None:
+        await self._reply_html(update, html.reply("welcome.html"))
+        await self._send_help(update, html)
+
+    async def _is_adm(self, update, context) -> bool:
+        if update.effective_chat.type != "group":
+            return True
+        return await self._telegram(utils.user_is_adm, update, context)
+
+    @_setup_async_callback
+    async def change_language(self, update, context, html: HTMLReplies) -> None:
+        """Change default language of the chat (/language)."""
+        chat_id = update.effective_chat.id
+        if not await self._is_adm(update, context):
+            await self._reply_html(update, html.reply("not_authorized.html"))
+            return
+
+        user_lang = "".join(context.args).upper() or html.default_lang
+        if not html.is_supported(user_lang):
+            reply = html.reply("change_lang_error.html", user_lang=user_lang)
+            await self._reply_html(update, reply)
+            return
+
+        await self.adb.set_chat_language(chat_id, user_lang)
+        html = get_replies(user_lang)
+        await self._reply_html(update, html.reply("change_lang_success.html"))
+
+    @_setup_async_callback
+    async def change_default_pool(self, update, context, html: HTMLReplies) -> None:
+        """Change default pool of the chat (/setpool)."""
+        if not await self._is_adm(update, context):
+            await self._reply_html(update, html.reply("not_authorized.html"))
+            return
+
+        chat_id = update.effective_chat.id
+        user_pool = "".join(context.args) or self.ebs_pool
+        if utils.is_malformed_pool_id(user_pool):
+            # reject invalid pool ids before saving them in the database
+            reply = html.reply("pool_info_error.html", ticker=user_pool)
+            await self._reply_html(update, reply)
+            return
+
+        await self.adb.set_default_pool(chat_id, user_pool)
+        await self._reply_html(update, html.reply("change_default_pool_success.html"))
+
+    @_setup_async_callback
+    async def epoch_info(self, update, context, html: HTMLReplies) -> None:
+        """Get information about the current epoch (/epoch)."""
+        res = await self.aapi.get_cached("epoch/", params={"currency_format": "ADA"})
+        template_args = self._epoch_args(res.get("data", None), html)
+        await self._reply_html(update, html.reply("epoch_info.html", **template_args))
+
+    @_setup_async_callback
+    async def pool_info(self, update, context, html: HTMLReplies) -> None:
+        """Get pool basic info (/pool)."""
+        if context.args:
+            stake_id = str("".join(context.args))
+            if utils.is_malformed_pool_id(stake_id):
+                reply = html.reply("pool_info_error.html", ticker=stake_id)
+                await self._reply_html(update, reply)
+                return
+        else:
+            chat_id = update.effective_chat.id
+            stake_id = await self.adb.get_chat_default_pool(chat_id)
+
+        # send the wait message while the pool info is being fetched
+        wait_message = "⌛ Fetching pool info, please wait..."
+        params = {"currency_format": "ADA"}
+        _, r = await asyncio.gather(
+            self._telegram(update.message.reply_text, wait_message),
+            self.aapi.get(f"pool/{stake_id}", params=params),
+        )
+        if r.status_code == 404:
+            reply = html.reply("pool_info_error.html", ticker=stake_id)
+            await self._reply_html(update, reply)
+            return
+
+        template_args = self._pool_args(r.json().get("data", None))
+        await self._reply_html(update, html.reply("pool_info.html", **template_args))
+
+    @_setup_async_callback
+    async def pots(self, update, context, html: HTMLReplies) -> None:
+        """Get info about cardano pots (/pots)."""
+        res = await self.aapi.get_cached("pots/", params={"currency_format": "ADA"})
+        template_args = self._pots_args(res.get("data", None))
+        await self._reply_html(update, html.reply("pots.html", **template_args))
+
+    @_setup_async_callback
+    async def netparams(self, update, context, html: HTMLReplies) -> None:
+        """Get network parameters (/netparams)."""
+        params = {"currency_format": "ADA"}
+        res = await self.aapi.get_cached("netparams/", params=params)
+        template_args = self._netparams_args(res.get("data", None))
+        await self._reply_html(update, html.reply("netparams.html", **template_args))
+
+    @_setup_async_callback
+    async def netstats(self, update, context, html: HTMLReplies) -> None:
+        """Get network statistics (/netstats)."""
+        params = {"currency_format": "ADA"}
+        res = await self.aapi.get_cached("netstats/", params=params)
+        template_args = self._netstats_args(res.get("data", None))
+        await self._reply_html(update, html.reply("netstats.html", **template_args))
+
+    @_setup_async_callback
+    async def balance(self, update, context, html: HTMLReplies) -> None:
+        """Get user balance."""
+        chat_id = update.message.from_user.id
+        r = await self.aapi.get(
+            f"chats/{chat_id}/balance/", params={"client_filter": "TELEGRAM"}
+        )
+        r.raise_for_status()
+        await self._reply_html(update, html.reply("chat_balance.html", **r.json()))
+
+    def _iter_cardabot_chats(self) -> Iterator[tuple[str, str]]:
+        """Yield (chat_id, language) of all cardabot chats, fetched on the loop."""
+        chats = self.adb.iter_chats(exclude_groups=True)
+        for chat in self.runtime.iterate(chats):
+            language = get_replies(chat.get("default_language")).language
+            yield chat.get("chat_id"), language
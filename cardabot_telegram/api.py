@@ -0,0 +1,265 @@
+"""Shared HTTP client for the CardaBot API."""
+import contextvars
+import os
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics, tracing
+
+
+def _env_number(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+class ResponseCache:
+    """TTL cache for network-wide API responses with single-flight loading.
+
+    Entries are keyed by endpoint and query params. Concurrent lookups of a missing
+    entry are coalesced, so only one upstream request is in flight per key and all
+    other callers wait for its result.
+
+    """
+
+    # seconds each endpoint response stays fresh; None means until the epoch ends
+    ttls = {
+        "epoch/": 5,
+        "pots/": 60,
+        "netstats/": 60,
+        "netparams/": None,
+    }
+    default_epoch_ttl = 3600  # used while the epoch boundary is still unknown
+
+    def __init__(self) -> None:
+        self._entries: dict[tuple, tuple[float, dict]] = {}
+        self._inflight: dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+        self._epoch_end = None  # monotonic time of the next epoch boundary
+        self.hits = 0
+        self.misses = 0
+
+    def _ttl(self, endpoint: str) -> float:
+        ttl = self.ttls.get(endpoint, 0)
+        if ttl is not None:
+            return ttl
+        if self._epoch_end is None:
+            return self.default_epoch_ttl
+        return max(self._epoch_end - time.monotonic(), 0)
+
+    def _claim(self, endpoint: str, params: dict | None, new_future):
+        """Look a key up, registering an in-flight load on a miss.
+
+        Returns (key, payload, future, leader): the cached payload on a hit; otherwise
+        the future to wait on, and whether the caller must load it (leader).
+
+        """
+        key = (endpoint, tuple(sorted((params or {}).items())))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                metrics.record_cache("response", hit=True)
+                return key, entry[1], None, False
+
+            self.misses += 1
+            metrics.record_cache("response", hit=False)
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = new_future()
+            return key, None, future, leader
+
+    def _store(self, endpoint: str, key: tuple, payload: dict) -> None:
+        with self._lock:
+            if endpoint == "epoch/":
+                remaining = (payload.get("data") or {}).get("remaining_time")
+                if remaining is not None:
+                    self._epoch_end = time.monotonic() + float(remaining)
+            self._entries[key] = (time.monotonic() + self._ttl(endpoint), payload)
+            del self._inflight[key]
+
+    def _discard(self, key: tuple) -> None:
+        with self._lock:
+            del self._inflight[key]
+
+    def get(self, endpoint: str, params: dict | None, loader) -> dict:
+        """Return the cached payload or load it, coalescing concurrent loads."""
+        key, payload, future, leader = self._claim(endpoint, params, Future)
+        if payload is not None:
+            return payload
+        if not leader:
+            return future.result()
+
+        try:
+            payload = loader()
+        except BaseException as e:
+            self._discard(key)
+            future.set_exception(e)
+            raise
+
+        self._store(endpoint, key, payload)
+        future.set_result(payload)
+        return payload
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
+
+
+class CardabotAPI:
+    """Thin wrapper around a pooled `requests.Session` for the CardaBot API.
+
+    Connections are kept alive and shared by every thread using the client. All
+    requests carry the API token and a (connect, read) timeout, and idempotent GETs
+    are retried with exponential backoff on connection errors and gateway failures.
+
+    """
+
+    def __init__(
+        self,
+        url: str,
+        token: str | None = None,
+        pool_size: int | None = None,
+        connect_timeout: float | None = None,
+        read_timeout: float | None = None,
+        retries: int | None = None,
+    ) -> None:
+        self.base_url = url
+        token = token or os.environ.get("CARDABOT_API_TOKEN")
+        self.headers = {"Authorization": "Token " + token}
+
+        # one pooled connection per thread calling the API for a command: dispatcher
+        # workers (python-telegram-bot default: 4) and the `gather` fan-out pool
+        pool_size = pool_size or int(
+            _env_number("BOT_WORKERS", 4) + _env_number("FANOUT_WORKERS", 16)
+        )
+        self.timeout = (
+            connect_timeout or _env_number("CARDABOT_API_CONNECT_TIMEOUT", 3.05),
+            read_timeout or _env_number("CARDABOT_API_READ_TIMEOUT", 15),
+        )
+
+        retries = Retry(
+            total=retries if retries is not None else 3,
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET"]),  # never retry non-idempotent calls
+            raise_on_status=False,  # callers inspect status codes themselves
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retries
+        )
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.cache = ResponseCache()
+
+    def url(self, endpoint: str) -> str:
+        """Return the absolute URL for an API endpoint."""
+        return os.path.join(self.base_url, endpoint)
+
+    def request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        with tracing.span("api", method=method, endpoint=endpoint) as span:
+            try:
+                r = self.session.request(method, self.url(endpoint), **kwargs)
+            finally:
+                metrics.record_api(method, time.perf_counter() - start)
+            span.set(status=r.status_code)
+            return r
+
+    def get(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("GET", endpoint, **kwargs)
+
+    def post(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("POST", endpoint, **kwargs)
+
+    def patch(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", endpoint, **kwargs)
+
+    def get_cached(self, endpoint: str, params: dict | None = None) -> dict:
+        """GET a network-wide endpoint through the shared response cache.
+
+        Returns the decoded JSON payload. Error responses raise and are not cached.
+
+        """
+
+        def load():
+            r = self.get(endpoint, params=params)
+            r.raise_for_status()
+            return r.json()
+
+        return self.cache.get(endpoint, params, load)
+
+
+_clients: dict[str, CardabotAPI] = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(url: str | None = None) -> CardabotAPI:
+    """Return the process-wide client for the given API url.
+
+    Defaults to the `CARDABOT_API_URL` environment variable.
+
+    """
+    url = url or os.environ.get("CARDABOT_API_URL")
+    with _clients_lock:
+        if url not in _clients:
+            _clients[url] = CardabotAPI(url)
+        return _clients[url]
+
+
+_fanout_pool = None
+_fanout_lock = threading.Lock()
+
+
+def _get_fanout_pool() -> ThreadPoolExecutor:
+    global _fanout_pool
+    with _fanout_lock:
+        if _fanout_pool is None:
+            _fanout_pool = ThreadPoolExecutor(
+                max_workers=int(os.environ.get("FANOUT_WORKERS", 16)),
+                thread_name_prefix="fanout",
+            )
+        return _fanout_pool
+
+
+def gather(*calls: Callable[[], Any]) -> list:
+    """Run independent API calls concurrently and return their results in order.
+
+    The first call runs in the calling thread, the others on a shared thread pool,
+    each in a copy of the caller's context. Waits for every call to finish and
+    re-raises the first error, if any.
+
+    Example:
+        sender, receiver = api.gather(
+            lambda: db.get_or_create_chat(sender_id),
+            lambda: db.get_or_create_chat(receiver_id),
+        )
+
+    """
+    if not calls:
+        return []
+
+    pool = _get_fanout_pool()
+    futures = [pool.submit(contextvars.copy_context().run, call) for call in calls[1:]]
+    first = Future()
+    try:
+        first.set_result(calls[0]())
+    except Exception as e:
+        first.set_exception(e)
+
+    wait(futures)
+    return [f.result() for f in [first, *futures]]
@@ -1,58 +1,70 @@
 import argparse
 import logging
 import os
-from datetime import datetime, timedelta
 
 from dotenv import load_dotenv
-from telegram.ext import CommandHandler, Updater
+from telegram.ext import Updater
+from telegram.utils.request import Request
 
-load_dotenv(override=True)
-from . import utils
+from . import handlers, metrics, notifications, replies, throttle, tracing
 from .callbacks import CardaBotCallbacks
 
 if __name__ == "__main__":
+    # importing the bot modules has no side effects: the environment only has to be
+    # loaded before the bot is set up below
+    load_dotenv(override=True)
 
     logging.basicConfig(
         format="%(asctime)s - %(name)s - %(levelname)s %(message)s", level=logging.INFO
     )
 
-    # telegram bot handlers
-    updater = Updater(os.environ.get("BOT_TOKEN"), use_context=True)
-    disp = updater.dispatcher
-    cbs = CardaBotCallbacks()
-
-    # schedule recurring jobs
-    start_date = datetime.now() + timedelta(seconds=utils.get_epoch_remaning_time())
-    utils.Scheduler.queue.add_job(
-        cbs.end_of_epoch_task,
-        "interval",
-        seconds=utils.get_epoch_duration(),
-        start_date=start_date,
-        args=[updater.bot],
-        id="end_of_epoch_task",
-    )
+    # structured JSON traces, sampled at TRACE_SAMPLE_RATE
+    tracing.setup()
 
-    # telegram bot commands
-    disp.add_handler(CommandHandler("start", cbs.start, run_async=True))
-    disp.add_handler(CommandHandler("pool", cbs.pool_info, run_async=True))
-    disp.add_handler(CommandHandler("language", cbs.change_language, run_async=True))
-    disp.add_handler(CommandHandler("setpool", cbs.change_default_pool, run_async=True))
-    disp.add_handler(CommandHandler("help", cbs.help, run_async=True))
-    disp.add_handler(CommandHandler("ebs", cbs.ebs, run_async=True))
-    disp.add_handler(CommandHandler("tip", cbs.tip))
-    disp.add_handler(CommandHandler("epoch", cbs.epoch_info, run_async=True))
-    disp.add_handler(CommandHandler("pots", cbs.pots, run_async=True))
-    disp.add_handler(CommandHandler("netparams", cbs.netparams, run_async=True))
-    disp.add_handler(CommandHandler("netstats", cbs.netstats, run_async=True))
-    disp.add_handler(CommandHandler("connect", cbs.connect, run_async=True))
-    disp.add_handler(CommandHandler("alert", cbs.alert, run_async=True))
-    disp.add_handler(CommandHandler("claim", cbs.claim, run_async=True))
-    disp.add_handler(CommandHandler("balance", cbs.balance, run_async=True))
+    # load and validate reply templates (fails fast on broken templates)
+    replies.load_templates()
 
     # parse command line arguments and start the bot accordingly
     parser = argparse.ArgumentParser()
     parser.add_argument("--prod", help="Run in production mode", action="store_true")
+    parser.add_argument(
+        "--async-mode",
+        help="Run API-bound commands on an asyncio event loop (or set ASYNC_MODE)",
+        action="store_true",
+    )
     args = parser.parse_known_args()
+    async_mode = args[0].async_mode or os.environ.get("ASYNC_MODE") == "true"
+
+    # one Bot API connection per thread sending messages (as the updater would do),
+    # plus the event loop's pool for blocking calls in async mode
+    workers = int(os.environ.get("BOT_WORKERS", 4))
+    con_pool_size = workers + 4
+    if async_mode:
+        con_pool_size += int(os.environ.get("ASYNC_BLOCKING_WORKERS", 16))
+
+    # telegram bot handlers, with Bot API requests timed for the metrics
+    bot = metrics.InstrumentedBot(
+        os.environ.get("BOT_TOKEN"), request=Request(con_pool_size=con_pool_size)
+    )
+    updater = Updater(bot=bot, workers=workers, use_context=True)
+    disp = updater.dispatcher
+
+    async_commands = frozenset()
+    if async_mode:
+        # aiohttp is only needed in async mode
+        from . import aio_callbacks
+
+        cbs = aio_callbacks.AsyncCardaBotCallbacks()
+        async_commands = aio_callbacks.ASYNC_COMMANDS
+    else:
+        cbs = CardaBotCallbacks()
+
+    # telegram bot commands, behind per-user and per-chat rate limits
+    limiter = throttle.Throttle(
+        [command for command, _, _ in handlers.COMMANDS], cbs.cardabotdb.cache
+    )
+    limiter.install(disp)
+    handlers.register(disp, cbs, async_commands, wrap=limiter.wrap)
 
     if args[0].prod:
         updater.start_webhook(  # start bot with webhook (use in production)
@@ -61,9 +73,20 @@ if __name__ == "__main__":
             url_path=os.environ.get("BOT_TOKEN"),
             webhook_url=os.environ.get("APP_DOMAIN") + os.environ.get("BOT_TOKEN"),
         )
+        # let the CardaBot API push tx and wallet connection updates
+        notifications.register(updater)
+        # export the command metrics (Prometheus)
+        metrics.register(updater)
     else:
         updater.start_polling()  # start bot with pooling (use when running local)
 
+    # start the scheduler and background work once the bot takes updates, so they
+    # don't delay the first replies after a restart
+    cbs.schedule_jobs(updater.bot)  # recurring jobs (persisted)
+    # resume broadcasts, tips and wallet connections interrupted by the last restart
+    cbs.resume_broadcasts(updater.bot)
+    cbs.resume_watches(updater.bot)
+
     # Run the bot until you press Ctrl-C or the process receives SIGINT, SIGTERM or
     # SIGABRT.
     updater.idle()
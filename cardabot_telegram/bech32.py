@@ -0,0 +1,143 @@
+"""Encode and decode bech32 strings, such as Cardano pool ids.
+
+Pure Python implementation of the bech32 format described in BIP-0173, with the
+length limit raised to the one used by Cardano tooling (addresses may exceed the 90
+characters allowed by BIP-0173).
+
+"""
+from collections.abc import Iterable
+
+CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+CHARSET_MAP = {c: i for i, c in enumerate(CHARSET)}
+GENERATOR = (0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3)
+MAX_LENGTH = 1023
+
+POOL_HRP = "pool"
+POOL_ID_SIZE = 28  # pool ids are blake2b-224 hashes of the pool cold key
+
+
+class Bech32Error(ValueError):
+    """Raised when a string is not valid bech32 or has an unexpected payload."""
+
+
+def _polymod(values: Iterable[int]) -> int:
+    chk = 1
+    for value in values:
+        top = chk >> 25
+        chk = (chk & 0x1FFFFFF) << 5 ^ value
+        for i, gen in enumerate(GENERATOR):
+            if (top >> i) & 1:
+                chk ^= gen
+    return chk
+
+
+def _hrp_expand(hrp: str) -> list[int]:
+    return [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+
+
+def _create_checksum(hrp: str, data: list[int]) -> list[int]:
+    polymod = _polymod(_hrp_expand(hrp) + data + [0] * 6) ^ 1
+    return [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+
+
+def _convert_bits(data: Iterable[int], frombits: int, tobits: int, pad: bool):
+    acc, bits, ret = 0, 0, []
+    maxv = (1 << tobits) - 1
+    for value in data:
+        acc = (acc << frombits) | value
+        bits += frombits
+        while bits >= tobits:
+            bits -= tobits
+            ret.append((acc >> bits) & maxv)
+
+    if pad:
+        if bits:
+            ret.append((acc << (tobits - bits)) & maxv)
+    elif bits >= frombits or ((acc << (tobits - bits)) & maxv):
+        raise Bech32Error("Invalid padding in bech32 data")
+
+    return ret
+
+
+def encode(hrp: str, data: bytes) -> str:
+    """Encode bytes as a bech32 string with the given human-readable part."""
+    values = _convert_bits(data, 8, 5, pad=True)
+    checksum = _create_checksum(hrp, values)
+    return hrp + "1" + "".join(CHARSET[v] for v in values + checksum)
+
+
+def decode(bech: str) -> tuple[str, bytes]:
+    """Decode a bech32 string, validating its checksum.
+
+    Returns:
+        A tuple with the human-readable part and the decoded payload.
+
+    Raises:
+        Bech32Error: if the string is not valid bech32.
+
+    """
+    if bech.lower() != bech and bech.upper() != bech:
+        raise Bech32Error("Mixed case bech32 string")
+    if len(bech) > MAX_LENGTH:
+        raise Bech32Error("Bech32 string too long")
+
+    bech = bech.lower()
+    pos = bech.rfind("1")
+    if pos < 1 or pos + 7 > len(bech):
+        raise Bech32Error("Missing bech32 separator or checksum")
+
+    hrp = bech[:pos]
+    if any(ord(c) < 33 or ord(c) > 126 for c in hrp):
+        raise Bech32Error("Invalid character in human-readable part")
+
+    try:
+        values = [CHARSET_MAP[c] for c in bech[pos + 1 :]]
+    except KeyError as e:
+        raise Bech32Error(f"Invalid bech32 character: {e.args[0]!r}") from None
+
+    if _polymod(_hrp_expand(hrp) + values) != 1:
+        raise Bech32Error("Invalid bech32 checksum")
+
+    return hrp, bytes(_convert_bits(values[:-6], 5, 8, pad=False))
+
+
+def pool_id_to_hex(pool_id: str) -> str:
+    """Convert a bech32 pool id (pool1...) to its hex representation."""
+    hrp, data = decode(pool_id)
+    if hrp != POOL_HRP or len(data) != POOL_ID_SIZE:
+        raise Bech32Error(f"Not a pool id: {pool_id}")
+    return data.hex()
+
+
+def hex_to_pool_id(pool_hex: str) -> str:
+    """Convert a hex pool id to its bech32 representation (pool1...)."""
+    try:
+        data = bytes.fromhex(pool_hex)
+    except ValueError:
+        raise Bech32Error(f"Invalid hex pool id: {pool_hex}") from None
+    if len(data) != POOL_ID_SIZE:
+        raise Bech32Error(f"Invalid hex pool id: {pool_hex}")
+    return encode(POOL_HRP, data)
+
+
+def pool_ids_to_hex(pool_ids: Iterable[str]) -> list[str]:
+    """Convert several bech32 pool ids to hex."""
+    return [pool_id_to_hex(pool_id) for pool_id in pool_ids]
+
+
+def hex_to_pool_ids(pool_hexes: Iterable[str]) -> list[str]:
+    """Convert several hex pool ids to bech32."""
+    return [hex_to_pool_id(pool_hex) for pool_hex in pool_hexes]
+
+
+def is_pool_id(value: str) -> bool:
+    """Return True if value is a valid pool id, either in bech32 or in hex."""
+    try:
+        if value.lower().startswith(POOL_HRP + "1"):
+            pool_id_to_hex(value)
+        else:
+            hex_to_pool_id(value)
+    except Bech32Error:
+        return False
+
+    return True
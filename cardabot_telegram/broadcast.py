@@ -0,0 +1,247 @@
+"""Send the same message to many Telegram chats."""
+import logging
+import os
+import random
+import threading
+import time
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+
+from telegram.error import BadRequest, ChatMigrated, RetryAfter, TimedOut, Unauthorized
+
+from .ratelimit import KeyedTokenBuckets, TokenBucket
+from .suppression import SuppressionIndex
+
+
+class TelegramRateLimiter:
+    """Global and per-chat token buckets matching the Telegram Bot API limits.
+
+    Telegram allows bots roughly 30 messages per second overall and 1 message per
+    second to the same chat.
+
+    """
+
+    def __init__(self, global_rate: float = 30, per_chat_rate: float = 1) -> None:
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets = KeyedTokenBuckets(per_chat_rate, capacity=1)
+
+    def acquire(self, chat_id: int | str) -> None:
+        self.chat_buckets[str(chat_id)].acquire()
+        self.global_bucket.acquire()
+
+    def pause(self, seconds: float) -> None:
+        """Back off from sending anything (flood control)."""
+        self.global_bucket.pause(seconds)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> TelegramRateLimiter:
+    """Return the process-wide Telegram rate limiter.
+
+    Limits can be tuned with `TELEGRAM_GLOBAL_RATE` and `TELEGRAM_CHAT_RATE`.
+
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = TelegramRateLimiter(
+                global_rate=float(os.environ.get("TELEGRAM_GLOBAL_RATE", 30)),
+                per_chat_rate=float(os.environ.get("TELEGRAM_CHAT_RATE", 1)),
+            )
+        return _limiter
+
+
+def dry_run_enabled() -> bool:
+    """Return True if broadcasts should only be simulated (`BROADCAST_DRY_RUN`)."""
+    return os.environ.get("BROADCAST_DRY_RUN", "").lower() in ("1", "true", "yes")
+
+
+@dataclass
+class BroadcastReport:
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    suppressed: int = 0
+    elapsed: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, status: str) -> None:
+        with self._lock:
+            setattr(self, status, getattr(self, status) + 1)
+
+    @property
+    def total(self) -> int:
+        return self.sent + self.failed + self.blocked + self.suppressed
+
+    def __str__(self) -> str:
+        return (
+            f"sent={self.sent} failed={self.failed} blocked={self.blocked} "
+            f"suppressed={self.suppressed} in {self.elapsed:.1f}s"
+        )
+
+
+class FakeBot:
+    """Stand-in for `telegram.Bot` that only simulates sending messages.
+
+    Used by the broadcast dry-run mode, so throughput can be measured offline.
+
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        blocked_ratio: float = 0.0,
+        flood_ratio: float = 0.0,
+    ) -> None:
+        self.latency = latency
+        self.blocked_ratio = blocked_ratio
+        self.flood_ratio = flood_ratio
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, parse_mode=None, **kwargs) -> None:
+        time.sleep(self.latency)
+        roll = random.random()
+        if roll < self.blocked_ratio:
+            raise Unauthorized("Forbidden: bot was blocked by the user")
+        if roll < self.blocked_ratio + self.flood_ratio:
+            raise RetryAfter(1)
+        with self._lock:
+            self.sent += 1
+
+
+class Broadcaster:
+    """Deliver a message to many chats using a pool of worker threads.
+
+    Sends go through the shared Telegram rate limiter. Flood errors (`RetryAfter`)
+    pause every worker for the time requested by Telegram before retrying, chats that
+    blocked the bot are counted apart from other failures, and transient network
+    errors are retried a few times (`max_retries`). Flood waits don't count as
+    retries: only Telegram asking again and again (`max_flood_waits`) fails a chat.
+
+    With a `suppression` index, chats known to be unreachable are skipped without
+    spending rate limit budget, and new unreachable chats are added to it.
+
+    """
+
+    def __init__(
+        self,
+        bot,
+        workers: int | None = None,
+        limiter: TelegramRateLimiter | None = None,
+        max_retries: int = 3,
+        max_flood_waits: int = 10,
+        dry_run: bool = False,
+        suppression: SuppressionIndex | None = None,
+    ) -> None:
+        self.bot = FakeBot() if dry_run else bot
+        self.dry_run = dry_run
+        self.suppression = suppression
+        self.workers = workers or int(os.environ.get("BROADCAST_WORKERS", 8))
+        self.limiter = limiter or get_rate_limiter()
+        self.max_retries = max_retries
+        self.max_flood_waits = max_flood_waits
+
+    def send_one(self, chat_id, text: str, parse_mode: str | None) -> str:
+        """Send a message to a single chat.
+
+        Returns the delivery status: "sent", "failed" or "blocked" (the bot was
+        blocked, or the chat doesn't exist anymore).
+
+        """
+        attempt = flood_waits = 0
+        while True:
+            self.limiter.acquire(chat_id)
+            try:
+                self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                return "sent"
+            except RetryAfter as e:
+                logging.warning("Flood control, pausing for %ss", e.retry_after)
+                self.limiter.pause(e.retry_after)
+                flood_waits += 1
+                if flood_waits > self.max_flood_waits:
+                    return "failed"
+                continue  # not a failed attempt: Telegram only asked to slow down
+            except ChatMigrated as e:
+                chat_id = e.new_chat_id
+            except Unauthorized as e:
+                logging.debug(f"Bot blocked by chat_id: {chat_id} ({repr(e)})")
+                return "blocked"
+            except BadRequest as e:
+                logging.debug(f"Invalid chat_id: {chat_id} ({repr(e)})")
+                if "chat not found" in e.message.lower():
+                    return "blocked"
+                return "failed"
+            except TimedOut as e:
+                logging.debug(f"Timed out sending to chat_id: {chat_id} ({repr(e)})")
+            except Exception as e:
+                logging.warning(f"Failed to send to chat_id: {chat_id} ({repr(e)})")
+                return "failed"
+
+            attempt += 1
+            if attempt > self.max_retries:
+                return "failed"
+
+    def _deliver(self, chat_id, text: str, parse_mode: str | None) -> str:
+        if self.suppression is None:
+            return self.send_one(chat_id, text, parse_mode)
+
+        if self.suppression.is_suppressed(chat_id):
+            return "suppressed"
+
+        status = self.send_one(chat_id, text, parse_mode)
+        if self.dry_run:
+            return status  # simulated results must not change the index
+        if status == "sent":
+            self.suppression.clear(chat_id)
+        elif status == "blocked":
+            self.suppression.record_failure(chat_id, reason="unreachable")
+        return status
+
+    def send(
+        self,
+        chat_ids: Iterable,
+        text: str,
+        parse_mode: str | None = "Markdown",
+        on_send: Callable[[int | str], None] | None = None,
+        on_result: Callable[[int | str, str], None] | None = None,
+    ) -> BroadcastReport:
+        """Send a message to every chat and return the delivery totals.
+
+        If given, `on_send` is called from the worker threads with each chat id right
+        before sending to it, and `on_result` with each chat id and its delivery
+        status as soon as the send completes.
+
+        """
+        report = BroadcastReport()
+        start = time.monotonic()
+        chat_ids = iter(chat_ids)
+        ids_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with ids_lock:
+                    chat_id = next(chat_ids, None)
+                if chat_id is None:
+                    return
+                if on_send is not None:
+                    on_send(chat_id)
+                status = self._deliver(chat_id, text, parse_mode)
+                report.add(status)
+                if on_result is not None:
+                    on_result(chat_id, status)
+
+        threads = [
+            threading.Thread(target=worker, name=f"broadcast-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        report.elapsed = time.monotonic() - start
+        return report
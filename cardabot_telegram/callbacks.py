@@ -1,25 +1,82 @@
+import contextlib
+import contextvars
+import functools
 import logging
 import os
 import re
-import secrets
+import threading
 import time
+from collections.abc import Iterator
 from datetime import datetime, timedelta
 
-import requests
+import pytz
+from apscheduler.jobstores.base import ConflictingIdError
+from apscheduler.triggers.interval import IntervalTrigger
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
-from . import database, utils
-from .replies import HTMLReplies
+from . import (
+    api,
+    connection,
+    database,
+    epoch,
+    jobs,
+    jobstore,
+    metrics,
+    profiling,
+    shared,
+    tracing,
+    utils,
+    watcher,
+)
+from .replies import HTMLReplies, get_replies
+
+
+@contextlib.contextmanager
+def instrument(name: str, update) -> Iterator[metrics.CommandStats]:
+    """Trace, measure and (when a session is active) profile a command."""
+    # /profile itself isn't profiled, so that `/profile off` can dump the report
+    if name == "profile_commands":
+        profile = contextlib.nullcontext()
+    else:
+        profile = profiling.profile(name)
+    with tracing.trace(name, f"update:{update.update_id}"):
+        with metrics.command(name) as stats, profile:
+            yield stats
+
+
+# (callbacks, bot) used by the persisted jobs, set by `CardaBotCallbacks.schedule_jobs`
+_job_runtime = None
+
+# a summary sent up to this late (e.g. after a restart) is still worth sending
+END_OF_EPOCH_GRACE = 6 * 3600
+
+
+def end_of_epoch_job() -> None:
+    """Scheduler entry point of `CardaBotCallbacks.end_of_epoch_task`.
+
+    Persisted jobs refer to their function by name and can't hold the bot, so the
+    job calls this function, which gets them from `_job_runtime`. Every worker runs
+    the job; the first one to take the lease sends the summary, and holds the lease
+    long enough for the others to skip this boundary.
+
+    """
+    lease_ttl = epoch.get_clock().epoch_duration / 2
+    if not shared.get_backend().acquire(
+        "end_of_epoch_task", shared.worker_id(), lease_ttl
+    ):
+        logging.info("End of epoch summary is sent by another worker")
+        return
+
+    cbs, bot = _job_runtime
+    cbs.end_of_epoch_task(bot)
 
 
 class CardaBotCallbacks:
     def __init__(self) -> None:
-        self.base_url = os.environ.get("CARDABOT_API_URL")
-        self.cardabotdb = database.CardabotDB(self.base_url)
+        self.api = api.shared_client()
+        self.base_url = self.api.base_url
+        self.cardabotdb = database.CardabotDB(self.base_url, client=self.api)
         self.ebs_pool = "pool1ndtsklata6rphamr6jw2p3ltnzayq3pezhg0djvn7n5js8rqlzh"
-        self.headers = {
-            "Authorization": "Token " + os.environ.get("CARDABOT_API_TOKEN")
-        }
 
     def _inform_error(self, context, chat_id):
         context.bot.send_message(
@@ -28,38 +85,43 @@ class CardaBotCallbacks:
         )
 
     def _setup_callback(func):
-        """Decorator to setup callback configs and handle exceptions."""
+        """Decorator to setup callback configs, instrument and handle exceptions."""
 
+        @functools.wraps(func)
         def callback(self, update, context):
-            try:
-                chat_id = update.effective_chat.id
-                language = self.cardabotdb.get_chat_language(chat_id)
-                html = HTMLReplies()
-                html.set_language(language)
-                func(self, update, context, html)
-
-            except Exception as e:
-                self._inform_error(context, chat_id)
-                logging.exception(e)
-                return
+            with instrument(func.__name__, update) as stats:
+                try:
+                    chat_id = update.effective_chat.id
+                    language = self.cardabotdb.get_chat_language(chat_id)
+                    html = get_replies(language)
+                    func(self, update, context, html)
+                    cache_stats = self.cardabotdb.cache_stats()
+                    logging.debug("Chat cache stats: %s", cache_stats)
+
+                except Exception as e:
+                    self._inform_error(context, chat_id)
+                    logging.exception(e)
+                    stats.failed = True
+                    return
 
         return callback
 
-    @_setup_callback
-    def help(self, update, context, html: HTMLReplies = HTMLReplies()) -> None:
+    def _send_help(self, update, html: HTMLReplies) -> None:
         update.message.reply_html(
             html.reply("help.html", supported_languages=html.supported_languages)
         )
 
     @_setup_callback
-    def start(self, update, context, html: HTMLReplies = HTMLReplies()) -> None:
+    def help(self, update, context, html: HTMLReplies) -> None:
+        self._send_help(update, html)
+
+    @_setup_callback
+    def start(self, update, context, html: HTMLReplies) -> None:
         update.message.reply_html(html.reply("welcome.html"))
-        self.help(update, context)
+        self._send_help(update, html)  # reuse the chat language already resolved
 
     @_setup_callback
-    def change_language(
-        self, update, context, html: HTMLReplies = HTMLReplies()
-    ) -> None:
+    def change_language(self, update, context, html: HTMLReplies) -> None:
         """Change default language of the chat (/language)."""
         chat_id = update.effective_chat.id
         if update.effective_chat.type == "group":
@@ -70,14 +132,15 @@ class CardaBotCallbacks:
         if not context.args:
             # set language to default (EN) when no args are passed by the user
             default_language = html.default_lang
-            html.set_language(default_language)
             self.cardabotdb.set_chat_language(chat_id, default_language)
+            html = get_replies(default_language)
             update.message.reply_html(html.reply("change_lang_success.html"))
             return
 
         user_lang = "".join(context.args).upper()
-        if html.set_language(user_lang):
+        if html.is_supported(user_lang):
             self.cardabotdb.set_chat_language(chat_id, user_lang)
+            html = get_replies(user_lang)
             update.message.reply_html(html.reply("change_lang_success.html"))
         else:
             update.message.reply_html(
@@ -85,9 +148,7 @@ class CardaBotCallbacks:
             )
 
     @_setup_callback
-    def change_default_pool(
-        self, update, context, html: HTMLReplies = HTMLReplies()
-    ) -> None:
+    def change_default_pool(self, update, context, html: HTMLReplies) -> None:
         """Change default pool of the chat (/setpool)."""
 
         if update.effective_chat.type == "group":
@@ -103,19 +164,19 @@ class CardaBotCallbacks:
             return
 
         user_pool = "".join(context.args)
+        if utils.is_malformed_pool_id(user_pool):
+            # reject invalid pool ids before saving them in the database
+            reply = html.reply("pool_info_error.html", ticker=user_pool)
+            update.message.reply_html(reply)
+            return
+
         self.cardabotdb.set_default_pool(chat_id, user_pool)
         update.message.reply_html(html.reply("change_default_pool_success.html"))
 
-    @_setup_callback
-    def epoch_info(self, update, context, html: HTMLReplies = HTMLReplies()) -> None:
-        """Get information about the current epoch (/epoch)."""
-        endpoint = "epoch/"
-        url = os.path.join(self.base_url, endpoint)
-        r = requests.get(url, headers=self.headers, params={"currency_format": "ADA"})
-        r.raise_for_status()  # captured by the _setup_callback decorator
-        data = r.json().get("data", None)
+    # reply template arguments, built from CardaBot API data
 
-        template_args = {
+    def _epoch_args(self, data: dict, html: HTMLReplies) -> dict:
+        return {
             "progress_bar": utils.get_progress_bar(data.get("percentage")),
             "perc": data.get("percentage"),
             "current_epoch": data.get("current_epoch"),
@@ -131,33 +192,9 @@ class CardaBotCallbacks:
             ),
         }
 
-        update.message.reply_html(html.reply("epoch_info.html", **template_args))
-
-    @_setup_callback
-    def pool_info(self, update, context, html: HTMLReplies = HTMLReplies()):
-        """Get pool basic info (/pool)."""
-        # get stake_id
-        if context.args:
-            stake_id = str("".join(context.args))
-        else:
-            chat_id = update.effective_chat.id
-            stake_id = self.cardabotdb.get_chat_default_pool(chat_id)
-
-        update.message.reply_text("⌛ Fetching pool info, please wait...")
-
-        endpoint = f"pool/{stake_id}"
-        url = os.path.join(self.base_url, endpoint)
-        r = requests.get(url, headers=self.headers, params={"currency_format": "ADA"})
-
+    def _pool_args(self, data: dict) -> dict:
         # fmt: off
-        if r.status_code == 404:
-            template_args = {"ticker": stake_id}
-            update.message.reply_html(html.reply("pool_info_error.html", **template_args))
-            return
-
-        data = r.json().get("data", None)
-
-        template_args = {
+        return {
             "ticker": data.get("ticker"),
             "name": data.get("name"),
             "description": data.get("description"),
@@ -176,18 +213,8 @@ class CardaBotCallbacks:
         }
         # fmt: on
 
-        update.message.reply_html(html.reply("pool_info.html", **template_args))
-
-    @_setup_callback
-    def pots(self, update, context, html: HTMLReplies = HTMLReplies()):
-        """Get info about cardano pots (/pots)."""
-        endpoint = "pots/"
-        url = os.path.join(self.base_url, endpoint)
-        r = requests.get(url, headers=self.headers, params={"currency_format": "ADA"})
-        r.raise_for_status()  # captured by the _setup_callback decorator
-        data = r.json().get("data", None)
-
-        template_args = {
+    def _pots_args(self, data: dict) -> dict:
+        return {
             "treasury": utils.fmt_ada(data.get("treasury")),
             "reserves": utils.fmt_ada(data.get("reserves")),
             "fees": utils.fmt_ada(data.get("fees")),
@@ -196,18 +223,8 @@ class CardaBotCallbacks:
             "deposits": utils.fmt_ada(data.get("deposits")),
         }
 
-        update.message.reply_html(html.reply("pots.html", **template_args))
-
-    @_setup_callback
-    def netparams(self, update, context, html: HTMLReplies = HTMLReplies()):
-        """Get network parameters (/netparams)."""
-        endpoint = "netparams/"
-        url = os.path.join(self.base_url, endpoint)
-        r = requests.get(url, headers=self.headers, params={"currency_format": "ADA"})
-        r.raise_for_status()  # captured by the _setup_callback decorator
-        data = r.json().get("data", None)
-
-        template_args = {
+    def _netparams_args(self, data: dict) -> dict:
+        return {
             "a0": data.get("a0"),
             "min_pool_cost": utils.fmt_ada(data.get("min_pool_cost")),
             "min_utxo_value": data.get("min_utxo_value"),
@@ -216,18 +233,8 @@ class CardaBotCallbacks:
             "tau": data.get("tau"),
         }
 
-        update.message.reply_html(html.reply("netparams.html", **template_args))
-
-    @_setup_callback
-    def netstats(self, update, context, html: HTMLReplies = HTMLReplies()):
-        """Get network statistics (/netstats)."""
-        endpoint = "netstats/"
-        url = os.path.join(self.base_url, endpoint)
-        r = requests.get(url, headers=self.headers, params={"currency_format": "ADA"})
-        r.raise_for_status()  # captured by the _setup_callback decorator
-        data = r.json().get("data", None)
-
-        template_args = {
+    def _netstats_args(self, data: dict) -> dict:
+        return {
             "ada_in_circulation": utils.fmt_ada(data.get("ada_in_circulation")),
             "percentage_in_stake": data.get("percentage_in_stake"),
             "stakepools": data.get("stakepools"),
@@ -237,6 +244,76 @@ class CardaBotCallbacks:
             "load_24h": data.get("load_24h"),
         }
 
+    @_setup_callback
+    def epoch_info(self, update, context, html: HTMLReplies) -> None:
+        """Get information about the current epoch (/epoch)."""
+        # captured by the _setup_callback decorator in case of errors
+        res = self.api.get_cached("epoch/", params={"currency_format": "ADA"})
+        data = res.get("data", None)
+
+        template_args = self._epoch_args(data, html)
+        update.message.reply_html(html.reply("epoch_info.html", **template_args))
+
+    @_setup_callback
+    def pool_info(self, update, context, html: HTMLReplies):
+        """Get pool basic info (/pool)."""
+        # get stake_id
+        if context.args:
+            stake_id = str("".join(context.args))
+            if utils.is_malformed_pool_id(stake_id):
+                reply = html.reply("pool_info_error.html", ticker=stake_id)
+                update.message.reply_html(reply)
+                return
+        else:
+            chat_id = update.effective_chat.id
+            stake_id = self.cardabotdb.get_chat_default_pool(chat_id)
+
+        # send the wait message while the pool info is being fetched
+        _, r = api.gather(
+            lambda: update.message.reply_text("⌛ Fetching pool info, please wait..."),
+            lambda: self.api.get(f"pool/{stake_id}", params={"currency_format": "ADA"}),
+        )
+
+        # fmt: off
+        if r.status_code == 404:
+            template_args = {"ticker": stake_id}
+            update.message.reply_html(html.reply("pool_info_error.html", **template_args))
+            return
+
+        data = r.json().get("data", None)
+        template_args = self._pool_args(data)
+        # fmt: on
+
+        update.message.reply_html(html.reply("pool_info.html", **template_args))
+
+    @_setup_callback
+    def pots(self, update, context, html: HTMLReplies):
+        """Get info about cardano pots (/pots)."""
+        # captured by the _setup_callback decorator in case of errors
+        res = self.api.get_cached("pots/", params={"currency_format": "ADA"})
+        data = res.get("data", None)
+
+        template_args = self._pots_args(data)
+        update.message.reply_html(html.reply("pots.html", **template_args))
+
+    @_setup_callback
+    def netparams(self, update, context, html: HTMLReplies):
+        """Get network parameters (/netparams)."""
+        # captured by the _setup_callback decorator in case of errors
+        res = self.api.get_cached("netparams/", params={"currency_format": "ADA"})
+        data = res.get("data", None)
+
+        template_args = self._netparams_args(data)
+        update.message.reply_html(html.reply("netparams.html", **template_args))
+
+    @_setup_callback
+    def netstats(self, update, context, html: HTMLReplies):
+        """Get network statistics (/netstats)."""
+        # captured by the _setup_callback decorator in case of errors
+        res = self.api.get_cached("netstats/", params={"currency_format": "ADA"})
+        data = res.get("data", None)
+
+        template_args = self._netstats_args(data)
         update.message.reply_html(html.reply("netstats.html", **template_args))
 
     def _get_cardabot_user_id(self, chat_id: str | int) -> int:
@@ -244,11 +321,7 @@ class CardaBotCallbacks:
 
         If chat is not connected, return None.
         """
-        res = requests.get(
-            os.path.join(self.base_url, f"chats/{chat_id}/"),
-            headers=self.headers,
-            params={"client_filter": "TELEGRAM"},
-        )
+        res = self.api.get(f"chats/{chat_id}/", params={"client_filter": "TELEGRAM"})
         res.raise_for_status()
 
         return res.json().get("cardabot_user_id", None)
@@ -256,18 +329,14 @@ class CardaBotCallbacks:
     def _get_cardabot_user_address(self, user_id: int) -> str:
         """Return the cardabot user address for the given user_id.
         """
-        res = requests.get(
-            os.path.join(self.base_url, f"users/{user_id}/"),
-            headers=self.headers,
-            params={"client_filter": "TELEGRAM"},
-        )
+        res = self.api.get(f"users/{user_id}/", params={"client_filter": "TELEGRAM"})
         res.raise_for_status()
 
         return res.json().get("stake_key", None)
 
 
     @_setup_callback
-    def connect(self, update, context, html: HTMLReplies = HTMLReplies()):
+    def connect(self, update, context, html: HTMLReplies):
         """Connect user wallet"""
         chat_id = update.effective_chat.id
 
@@ -277,10 +346,8 @@ class CardaBotCallbacks:
             return
 
         ## Get token from chat_id
-        r = requests.get(
-            os.path.join(self.base_url, f"chats/{chat_id}/token/"),
-            headers=self.headers,
-            params={"client_filter": "TELEGRAM"},
+        r = self.api.get(
+            f"chats/{chat_id}/token/", params={"client_filter": "TELEGRAM"}
         )
         r.raise_for_status()  # captured by the _setup_callback decorator
         tmp_token = r.json().get("tmp_token", None)
@@ -310,28 +377,45 @@ class CardaBotCallbacks:
             ),
         )
 
-        # task to run for a couple of minutes or until the user connects his wallet
-        def update_message(message, cardabot_user, chat_id, job_id):
-            cardabot_user_id = self._get_cardabot_user_id(chat_id)
-            stake_addr = self._get_cardabot_user_address(cardabot_user_id)
-            if cardabot_user_id != None:
-                message.edit_text(
-                    html.reply("connection_success.html", stake_address=stake_addr), parse_mode="HTML"
-                )
-                utils.Scheduler.queue.remove_job(job_id)
+        # check for a couple of minutes or until the user connects his wallet
+        params = {
+            "chat_id": chat_id,
+            "message_id": message.message_id,
+            "language": html.language,
+        }
+        check, on_expire = self._connect_watch(context.bot, params)
+        watcher.get_watcher().add(
+            f"connect:{chat_id}",  # replaces any previous attempt of this chat
+            check,
+            on_expire=on_expire,
+            timeout=20 + 7 * 60,
+            first_check=20,
+            interval=5,
+            max_interval=15,
+            kind="connect",
+            params=params,
+        )
+        connection.metrics.add(attempts=1)
+
+    def _connect_watch(self, bot, params: dict):
+        """Return the (check, on_expire) callbacks of a pending wallet connection."""
+        html = get_replies(params["language"])
+
+        def notify_connected(stake_address):
+            bot.edit_message_text(
+                html.reply("connection_success.html", stake_address=stake_address),
+                chat_id=params["chat_id"],
+                message_id=params["message_id"],
+                parse_mode="HTML",
+            )
 
-        start_date = datetime.now() + timedelta(seconds=20)
-        end_date = start_date + timedelta(seconds=7 * 60)
-        job_id = secrets.token_urlsafe(6)  # generate tmp id for the job
-        utils.Scheduler.queue.add_job(  # add job to scheduler
-            update_message,
-            "interval",
-            seconds=10,
-            start_date=start_date,
-            end_date=end_date,
-            args=[message, self._get_cardabot_user_id(chat_id), chat_id, job_id],
-            id=job_id,
+        tracker = connection.ConnectionTracker(
+            params["chat_id"],
+            get_user_id=self._get_cardabot_user_id,
+            get_address=self._get_cardabot_user_address,
+            on_connected=notify_connected,
         )
+        return tracker.check, tracker.expire
 
     def ebs(self, update, context) -> None:
         update.message.reply_text(
@@ -381,7 +465,7 @@ class CardaBotCallbacks:
         return network
 
     @_setup_callback
-    def tip(self, update, context, html: HTMLReplies = HTMLReplies()):
+    def tip(self, update, context, html: HTMLReplies):
         """Tip a user"""
         if update.message.reply_to_message is None:
             # only allow tip if msg is a response to a user
@@ -394,9 +478,13 @@ class CardaBotCallbacks:
             update.message.reply_html(html.reply("tip_refused.html"))
             return
 
-        # make sure to create chat_ids for recipient and sender
-        self.cardabotdb.get_or_create_chat(int(update.message.from_user.id))
-        self.cardabotdb.get_or_create_chat(int(update.message.reply_to_message.from_user.id))
+        # make sure to create chat_ids for recipient and sender (concurrently)
+        sender_id = int(update.message.from_user.id)
+        receiver_id = int(update.message.reply_to_message.from_user.id)
+        api.gather(
+            lambda: self.cardabotdb.get_or_create_chat(sender_id),
+            lambda: self.cardabotdb.get_or_create_chat(receiver_id),
+        )
 
         # get data for building tx
         data = {
@@ -408,9 +496,7 @@ class CardaBotCallbacks:
         }
 
         # call cardabot-api to build the tx (get tx_id)
-        r = requests.post(
-            os.path.join(self.base_url, "unsignedtx/"), headers=self.headers, data=data
-        )
+        r = self.api.post("unsignedtx/", data=data)
 
         # verify the tx response
         if r.status_code >= 400:
@@ -450,23 +536,40 @@ class CardaBotCallbacks:
             ),
         )
 
-        # task to run for a couple of minutes or until the tx is submitted to network
-        def update_message(message, tx_id, network, job_id, end_date):
-            r = requests.get(
-                os.path.join(self.base_url, f"checktx/{tx_id}/"),
-                headers=self.headers,
-            )
+        # check for a couple of minutes or until the tx is submitted to network
+        params = {
+            "tx_id": tx_id,
+            "chat_id": message.chat_id,
+            "message_id": message.message_id,
+            "language": html.language,
+        }
+        check_tx, tx_expired = self._tx_watch(context.bot, params)
+        watcher.get_watcher().add(
+            f"tx:{tx_id}",
+            check_tx,
+            on_expire=tx_expired,
+            timeout=600,
+            first_check=1,
+            interval=5,
+            max_interval=30,
+            kind="tx",
+            params=params,
+        )
 
+    def _tx_watch(self, bot, params: dict):
+        """Return the (check, on_expire) callbacks of a pending tip transaction."""
+        tx_id = params["tx_id"]
+        message = {"chat_id": params["chat_id"], "message_id": params["message_id"]}
+        html = get_replies(params["language"])
+        network = self._get_network()
+
+        def check_tx():
+            r = self.api.get(f"checktx/{tx_id}/")
             if r.status_code != 200:
-                if datetime.now() > end_date - timedelta(seconds=30):
-                    message.edit_text(
-                        text=html.reply("tip_fail.html"), parse_mode="HTML"
-                    )
-                    utils.Scheduler.queue.remove_job(job_id)
-                return
+                return False
 
             net = network + "." if network == "testnet" else ""
-            message.edit_text(
+            bot.edit_message_text(
                 text="✅ Your transaction was submitted!",
                 reply_markup=InlineKeyboardMarkup(
                     [
@@ -478,39 +581,38 @@ class CardaBotCallbacks:
                         ],
                     ]
                 ),
+                **message,
             )
-            utils.Scheduler.queue.remove_job(job_id)
+            return True
 
-        start_date = datetime.now() + timedelta(seconds=1)
-        end_date = start_date + timedelta(seconds=600)
-        job_id = secrets.token_urlsafe(6)  # generate tmp id for the job
-        utils.Scheduler.queue.add_job(  # add job to scheduler
-            update_message,
-            "interval",
-            seconds=30,
-            start_date=start_date,
-            end_date=end_date,
-            args=[message, tx_id, self._get_network(), job_id, end_date],
-            id=job_id,
-        )
+        def tx_expired():
+            bot.edit_message_text(
+                text=html.reply("tip_fail.html"), parse_mode="HTML", **message
+            )
+
+        return check_tx, tx_expired
 
-    def _get_all_cardabot_chats(self) -> list[str]:
-        """Get all cardabot chats from database, excluding groups."""
-        r = requests.get(
-            os.path.join(self.base_url, "chats/"),
-            headers=self.headers,
-            params={"client_filter": "TELEGRAM"},
+    def resume_watches(self, bot) -> None:
+        """Resume the tips and wallet connections pending before a restart."""
+        resumed = watcher.get_watcher().resume(
+            {
+                "tx": functools.partial(self._tx_watch, bot),
+                "connect": functools.partial(self._connect_watch, bot),
+            }
         )
-        r.raise_for_status()
+        logging.info("Resumed %s pending watches", resumed)
 
-        chat_ids = [
-            chat.get("chat_id") for chat in r.json() if int(chat.get("chat_id")) > 0
-        ]  # exclude telegram group chats
+    def _iter_cardabot_chats(self) -> Iterator[tuple[str, str]]:
+        """Yield (chat_id, language) of all cardabot chats, excluding groups.
 
-        return chat_ids
+        Chats are fetched page by page, so broadcasts can start after the first page.
+        """
+        for chat in self.cardabotdb.iter_chats(exclude_groups=True):
+            language = get_replies(chat.get("default_language")).language
+            yield chat.get("chat_id"), language
 
     @_setup_callback
-    def alert(self, update, context, html: HTMLReplies = HTMLReplies()):
+    def alert(self, update, context, html: HTMLReplies):
         """Send a message to all users."""
         sender_chat_id = os.environ.get("ADMIN_CHAT_ID")
         if str(update.effective_user.id) != sender_chat_id:
@@ -518,16 +620,73 @@ class CardaBotCallbacks:
             return
 
         message = update.message.text.split(" ", 1)[1]
-        chat_ids = self._get_all_cardabot_chats()
+        runner = self._broadcast_runner(context.bot)
+        job_id = runner.create("alert", message)
+        update.message.reply_html(html.reply("broadcast_started.html", job_id=job_id))
+
+        # deliver in the background, so the dispatcher worker is released right away
+        # (in this trace)
+        run = functools.partial(contextvars.copy_context().run, runner.run, job_id)
+        threading.Thread(target=run, daemon=True).start()
+
+    def _broadcast_runner(self, bot) -> jobs.BroadcastJobRunner:
+        """Return a broadcast job runner targeting every cardabot chat."""
+        return jobs.BroadcastJobRunner(bot, audience=self._iter_cardabot_chats)
+
+    def resume_broadcasts(self, bot) -> None:
+        """Resume broadcasts interrupted by a restart, in a background thread."""
+        runner = self._broadcast_runner(bot)
+        threading.Thread(target=runner.resume_all, daemon=True).start()
+
+    @_setup_callback
+    def broadcast_status(self, update, context, html: HTMLReplies):
+        """Show the progress of the latest broadcasts (/broadcasts)."""
+        if str(update.effective_user.id) != os.environ.get("ADMIN_CHAT_ID"):
+            update.message.reply_html(html.reply("endpoint_refused.html"))
+            return
+
+        store = jobs.get_store()
+        lines = []
+        for job in store.recent_jobs():
+            progress = store.progress(job["id"])
+            total = sum(progress.values())
+            left = progress.get(jobs.PENDING, 0) + progress.get(jobs.IN_FLIGHT, 0)
+            done = total - left
+            states = ", ".join(f"{k}: {v}" for k, v in sorted(progress.items()))
+            lines.append(
+                f"#{job['id']} {job['kind']} [{job['status']}] "
+                f"{done}/{total} ({states or 'no recipients yet'})"
+            )
+
+        jobs_text = "\n".join(lines) or "-"
+        update.message.reply_html(html.reply("broadcast_status.html", jobs=jobs_text))
+
+    @_setup_callback
+    def profile_commands(self, update, context, html: HTMLReplies):
+        """Profile the next commands (/profile on [n], /profile off, /profile)."""
+        if str(update.effective_user.id) != os.environ.get("ADMIN_CHAT_ID"):
+            update.message.reply_html(html.reply("endpoint_refused.html"))
+            return
+
+        profiler = profiling.get_profiler()
+        action = context.args[0].lower() if context.args else "status"
+        if action == "on":
+            commands = int(context.args[1]) if len(context.args) > 1 else 50
+            profiler.start(commands)
+            status = profiler.status()
+        elif action == "off":
+            path = profiler.stop()
+            status = f"off, report: {path}" if path else profiler.status()
+        else:
+            status = profiler.status()
 
-        utils.send_to_all(bot=context.bot, chat_ids=chat_ids, text=message)
+        update.message.reply_html(html.reply("profile_status.html", status=status))
 
+    @tracing.job("end_of_epoch_task")
+    @profiling.job("end_of_epoch_task")
     def end_of_epoch_task(self, bot) -> None:
         """Send of epoch summary to all users."""
-        html = HTMLReplies()
-        endpoint = "epochsummary/"
-        url = os.path.join(self.base_url, endpoint)
-        r = requests.get(url, headers=self.headers, params={"currency_format": "ADA"})
+        r = self.api.get("epochsummary/", params={"currency_format": "ADA"})
         r.raise_for_status()  # captured by the _setup_callback decorator
         data = r.json().get("data", None)
 
@@ -540,22 +699,101 @@ class CardaBotCallbacks:
             "treasury": utils.fmt_ada(data.get("treasury", None)),
         }
 
-        message = html.reply("end_of_epoch_summary.html", **template_args)
-        chat_ids = self._get_all_cardabot_chats() #TODO: exclude users that have disabled the bot messages
-        logging.info("Sending end of epoch summary message to: %s", chat_ids)
-        utils.send_to_all(bot=bot, chat_ids=chat_ids, text=message, parse_mode="HTML")
+        # render the summary once per language, recipients get their chat's variant
+        messages = {
+            lang: get_replies(lang).reply("end_of_epoch_summary.html", **template_args)
+            for lang in HTMLReplies.supported_languages
+        }
+        # chats that blocked the bot are skipped by the broadcast suppression index
+        runner = self._broadcast_runner(bot)
+        job_id = runner.create(
+            "end_of_epoch",
+            messages[HTMLReplies.default_language],
+            parse_mode="HTML",
+            variants=messages,
+        )
+        logging.info("Sending end of epoch summary message (broadcast %s)", job_id)
+        runner.run(job_id)
+
+    def schedule_jobs(self, bot) -> None:
+        """Schedule the recurring jobs, in a job store that survives restarts.
+
+        The end of epoch summary fires at every epoch boundary of the local epoch
+        clock, so no API call is needed on startup. A job scheduled before a restart
+        keeps its pending run: runs missed while the bot was down are coalesced into
+        one, run right away if still within the grace time.
+
+        """
+        global _job_runtime
+        _job_runtime = (self, bot)  # before the store is loaded and runs overdue jobs
+
+        queue = utils.get_scheduler()
+        queue.add_jobstore(jobstore.SQLiteJobStore(), "persistent")
+        job = queue.get_job("end_of_epoch_task", jobstore="persistent")
+        if job is None:
+            try:
+                queue.add_job(
+                    end_of_epoch_job,
+                    self._end_of_epoch_trigger(),
+                    id="end_of_epoch_task",
+                    jobstore="persistent",
+                    coalesce=True,
+                    misfire_grace_time=END_OF_EPOCH_GRACE,
+                )
+            except ConflictingIdError:
+                # another worker sharing the store created it meanwhile
+                logging.info("End of epoch summary job already scheduled")
+        elif job.next_run_time and job.next_run_time.timestamp() > time.time():
+            # (re)align a future run, e.g. one scheduled from the API's remaining time
+            job.reschedule(self._end_of_epoch_trigger())
+
+        # check the epoch clock against the API shortly after startup, then regularly
+        queue.add_job(
+            self.reconcile_epoch_clock,
+            "interval",
+            seconds=float(os.environ.get("EPOCH_RECONCILE_INTERVAL", 6 * 3600)),
+            next_run_time=datetime.now() + timedelta(minutes=1),
+            id="epoch_reconcile",
+            replace_existing=True,
+        )
+
+    def _end_of_epoch_trigger(self) -> IntervalTrigger:
+        """Return a trigger firing at every boundary of the local epoch clock."""
+        clock = epoch.get_clock(self._get_network())
+        return IntervalTrigger(
+            seconds=clock.epoch_duration,
+            start_date=datetime.fromtimestamp(clock.next_boundary(), pytz.utc),
+            timezone=pytz.utc,
+        )
+
+    def reconcile_epoch_clock(self) -> None:
+        """Correct the epoch clock from the CardaBot API, if they disagree."""
+        r = self.api.get("epoch/")
+        r.raise_for_status()
+        data = r.json().get("data") or {}
+
+        clock = epoch.get_clock(self._get_network())
+        if clock.reconcile(data["current_epoch"], data["remaining_time"]):
+            utils.get_scheduler().reschedule_job(
+                "end_of_epoch_task",
+                jobstore="persistent",
+                trigger=self._end_of_epoch_trigger(),
+            )
 
     @_setup_callback
-    def claim(self, update, context, html: HTMLReplies = HTMLReplies()):
+    def claim(self, update, context, html: HTMLReplies):
         """Claim user funds that are being held temporarily."""
-        update.message.reply_text(f"⌛️ We're transfering your funds, please wait...")
-
         chat_id = update.message.from_user.id
-        r = requests.post(
-            os.path.join(self.base_url, "claim/"),
-            headers=self.headers,
-            params={"client_filter": "TELEGRAM"},
-            data={"chat_id_receiver": chat_id},
+        # send the wait message while the claim is being processed
+        _, r = api.gather(
+            lambda: update.message.reply_text(
+                f"⌛️ We're transfering your funds, please wait..."
+            ),
+            lambda: self.api.post(
+                "claim/",
+                params={"client_filter": "TELEGRAM"},
+                data={"chat_id_receiver": chat_id},
+            ),
         )
 
         if r.status_code == 406 or r.status_code == 404:
@@ -584,14 +822,12 @@ class CardaBotCallbacks:
         return
 
     @_setup_callback
-    def balance(self, update, context, html: HTMLReplies = HTMLReplies()):
+    def balance(self, update, context, html: HTMLReplies):
         """Get user balance."""
         chat_id = update.message.from_user.id
 
-        r = requests.get(
-            os.path.join(self.base_url, f"chats/{chat_id}/balance/"),
-            headers=self.headers,
-            params={"client_filter": "TELEGRAM"},
+        r = self.api.get(
+            f"chats/{chat_id}/balance/", params={"client_filter": "TELEGRAM"}
         )
         r.raise_for_status()
 
@@ -0,0 +1,108 @@
+"""Track pending wallet connections (/connect)."""
+import enum
+import logging
+import threading
+from collections.abc import Callable
+
+
+class ConnectionState(enum.Enum):
+    WAITING = "waiting"  # user hasn't connected a wallet yet
+    CONNECTED = "connected"  # wallet connected, stake address not fetched yet
+    NOTIFIED = "notified"  # user was told the connection succeeded
+    EXPIRED = "expired"  # gave up waiting
+
+
+class ConnectMetrics:
+    """Counters of API calls spent on watching wallet connections."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.successes = 0
+        self.expired = 0
+        self.api_calls = 0
+
+    def add(self, **counters: int) -> None:
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def calls_per_success(self) -> float:
+        """API calls per successful connection, counting calls of expired attempts."""
+        with self._lock:
+            return self.api_calls / self.successes if self.successes else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "attempts": self.attempts,
+                "successes": self.successes,
+                "expired": self.expired,
+                "api_calls": self.api_calls,
+            }
+
+
+metrics = ConnectMetrics()
+
+
+class ConnectionTracker:
+    """State machine for a pending wallet connection, driven by the watcher.
+
+    While waiting, each check makes a single API call, looking up whether the chat
+    is linked to a cardabot user. The check that finds the link also fetches the
+    user's stake address (the only other call) and notifies the user right away. A
+    failed address lookup is retried on the next check without asking for the user
+    id again.
+
+    Trackers are rebuilt when a watch is resumed, so attempts are counted by the
+    caller starting the connection (`metrics.add(attempts=1)`), not here.
+
+    """
+
+    def __init__(
+        self,
+        chat_id: int | str,
+        get_user_id: Callable[[int | str], int | None],
+        get_address: Callable[[int], str],
+        on_connected: Callable[[str], None],
+    ) -> None:
+        self.chat_id = chat_id
+        self.get_user_id = get_user_id
+        self.get_address = get_address
+        self.on_connected = on_connected
+        self.state = ConnectionState.WAITING
+        self.user_id = None
+        self.api_calls = 0
+
+    def _call(self, func, *args):
+        self.api_calls += 1
+        metrics.add(api_calls=1)
+        return func(*args)
+
+    def check(self) -> bool:
+        """Advance the state machine; return True once the user was notified."""
+        if self.state is ConnectionState.WAITING:
+            self.user_id = self._call(self.get_user_id, self.chat_id)
+            if self.user_id is None:
+                return False
+            self.state = ConnectionState.CONNECTED  # fetch the address right away
+
+        if self.state is ConnectionState.CONNECTED:
+            stake_address = self._call(self.get_address, self.user_id)
+            self.on_connected(stake_address)
+            self.state = ConnectionState.NOTIFIED
+            metrics.add(successes=1)
+            logging.info(
+                "Chat %s connected after %s API calls (%.1f per connect overall)",
+                self.chat_id,
+                self.api_calls,
+                metrics.calls_per_success,
+            )
+
+        return self.state is ConnectionState.NOTIFIED
+
+    def expire(self) -> None:
+        if self.state is not ConnectionState.NOTIFIED:
+            self.state = ConnectionState.EXPIRED
+            metrics.add(expired=1)
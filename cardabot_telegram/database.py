@@ -1,15 +1,106 @@
 """Manage chat objects in the CardaBot database."""
 import os
-import requests
+import threading
+from collections.abc import AsyncIterator, Iterator
+
+from cachetools import TTLCache
+
+from . import api, metrics, shared, tracing
+
+
+class ChatCache:
+    """Bounded, thread-safe cache of chat objects with LRU and TTL eviction.
+
+    Keeps hit/miss counters so cache efficiency can be logged. With a shared
+    `backend` (see `shared`), chats are cached there instead of in this process, so
+    that a setting changed through one worker (e.g. `/language`) is seen by all.
+
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 4096,
+        ttl: float = 600,
+        backend: shared.SharedBackend | None = None,
+    ) -> None:
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.backend = backend if backend is not None and backend.shared else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(chat_id: int | str) -> str:
+        return f"chat:{chat_id}"
+
+    def get(self, chat_id: int | str) -> dict | None:
+        if self.backend is not None:
+            chat = self.backend.get(self._key(chat_id))
+        with self._lock:
+            if self.backend is None:
+                chat = self._cache.get(str(chat_id))
+            if chat is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.record_cache("chat", hit=chat is not None)
+        return chat
+
+    def set(self, chat_id: int | str, chat: dict) -> None:
+        if self.backend is not None:
+            self.backend.set(self._key(chat_id), chat, self.ttl)
+            return
+        with self._lock:
+            self._cache[str(chat_id)] = chat
+
+    def update(self, chat_id: int | str, data: dict) -> None:
+        """Write changed fields through to a cached chat, if present."""
+        if self.backend is not None:
+            # a read-modify-write isn't atomic between workers: drop the chat instead,
+            # the next command fetches it again
+            self.backend.delete(self._key(chat_id))
+            return
+        with self._lock:
+            chat = self._cache.get(str(chat_id))
+            if chat is not None:
+                self._cache[str(chat_id)] = {**chat, **data}
+
+    def invalidate(self, chat_id: int | str) -> None:
+        if self.backend is not None:
+            self.backend.delete(self._key(chat_id))
+            return
+        with self._lock:
+            self._cache.pop(str(chat_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "shared": self.backend is not None,
+            }
 
 
 class CardabotDB:
-    def __init__(self, url: str, token: str = "") -> None:
-        self.base_url = url
+    def __init__(
+        self,
+        url: str,
+        token: str = "",
+        client: api.CardabotAPI | None = None,
+        cache: ChatCache | None = None,
+    ) -> None:
+        self.client = client or api.shared_client(url)
+        self.base_url = self.client.base_url
         self.token = token
-        self.headers = {
-            "Authorization": "Token " + os.environ.get("CARDABOT_API_TOKEN")
-        }
+        self.headers = self.client.headers
+        self.cache = cache or ChatCache(
+            maxsize=int(os.environ.get("CHAT_CACHE_SIZE", 4096)),
+            ttl=float(os.environ.get("CHAT_CACHE_TTL", 600)),
+            backend=shared.get_backend(),
+        )
 
     def create_chat(self, chat_id: int | str) -> dict:
         """Create chat object with default options."""
@@ -17,29 +108,63 @@ class CardabotDB:
             "chat_id": str(chat_id),
             "client": "TELEGRAM",
         }
-        url = os.path.join(self.base_url, "chats/")
-        r = requests.post(url, headers=self.headers, json=data)
+        r = self.client.post("chats/", json=data)
         r.raise_for_status()
-        return r.json()
+        chat = r.json()
+        self.cache.set(chat_id, chat)
+        return chat
 
     def get_or_create_chat(self, chat_id: int) -> dict:
         """Returns chat object from database.
 
         If chat_id is not present, then create new chat object with default options.
+        Chat objects are served from the local cache whenever possible.
         """
-        endpoint = f"chats/{chat_id}/"
-        url = os.path.join(self.base_url, endpoint)
-        r = requests.get(
-            url, headers=self.headers, params={"client_filter": "TELEGRAM"}
-        )
+        chat = self.cache.get(chat_id)
+        if chat is not None:
+            return chat
 
-        # print(r.text)
+        with tracing.span("chat.fetch", chat_id=chat_id):
+            endpoint = f"chats/{chat_id}/"
+            r = self.client.get(endpoint, params={"client_filter": "TELEGRAM"})
 
-        if r.status_code == 404 and "not found" in r.json()["detail"].lower():
-            return self.create_chat(chat_id)
+            # print(r.text)
 
-        r.raise_for_status()
-        return r.json()
+            if r.status_code == 404 and "not found" in r.json()["detail"].lower():
+                return self.create_chat(chat_id)
+
+            r.raise_for_status()
+            chat = r.json()
+            self.cache.set(chat_id, chat)
+            return chat
+
+    def iter_chats(
+        self, page_size: int = 500, exclude_groups: bool = True
+    ) -> Iterator[dict]:
+        """Yield every telegram chat object, one API page at a time.
+
+        Group chats (negative ids) are filtered by the API when `exclude_groups` is
+        set; they are also skipped here in case the API ignores the filter. APIs that
+        don't paginate `chats/` return a plain list, which is yielded as one page.
+
+        """
+        params = {"client_filter": "TELEGRAM", "page_size": page_size}
+        if exclude_groups:
+            params["exclude_groups"] = "true"
+
+        page = 1
+        while True:
+            r = self.client.get("chats/", params={**params, "page": page})
+            r.raise_for_status()
+            data = r.json()
+            chats = data if isinstance(data, list) else data.get("results", [])
+            for chat in chats:
+                if not exclude_groups or int(chat.get("chat_id")) > 0:
+                    yield chat
+
+            if isinstance(data, list) or not data.get("next") or not chats:
+                return
+            page += 1
 
     def get_chat_default_pool(self, chat_id: int) -> str:
         res = self.get_or_create_chat(chat_id)
@@ -49,28 +174,136 @@ class CardabotDB:
         res = self.get_or_create_chat(chat_id)
         return res["default_language"]
 
+    def _update_chat(self, chat_id: int, data: dict) -> None:
+        """Patch chat settings and write the change through to the cache."""
+        endpoint = f"chats/{chat_id}/"
+        params = {"client_filter": "TELEGRAM"}
+        r = self.client.patch(endpoint, json=data, params=params)
+        if r.status_code == 404:
+            # chat is not registered in database yet, create one and try again
+            self.create_chat(chat_id)
+            r = self.client.patch(endpoint, json=data, params=params)
+
+        if not r.ok:
+            self.cache.invalidate(chat_id)
+        r.raise_for_status()
+        self.cache.update(chat_id, data)
+
     def set_chat_language(self, chat_id: int, lang: str) -> None:
         """Set chat default language."""
-        # make sure chat is registered in database, otherwise create one
-        self.get_or_create_chat(chat_id)
+        self._update_chat(chat_id, {"default_language": lang})
 
-        endpoint = f"chats/{chat_id}/"
-        url = os.path.join(self.base_url, endpoint)
-        data = {"default_language": lang}
-        r = requests.patch(
-            url, json=data, headers=self.headers, params={"client_filter": "TELEGRAM"}
+    def set_default_pool(self, chat_id: int, pool: str) -> None:
+        """Set the default pool using pool ticker."""
+        self._update_chat(chat_id, {"default_pool_id": pool})
+
+    def cache_stats(self) -> dict:
+        """Return hit/miss counters of the chat settings cache."""
+        return self.cache.stats()
+
+
+class AsyncCardabotDB:
+    """Coroutine version of `CardabotDB`, for the asyncio execution mode.
+
+    `client` is an `aio.AsyncCardabotAPI`. The chat cache can be shared with a
+    `CardabotDB`, so both modes see the same chat settings.
+
+    """
+
+    def __init__(self, client, cache: ChatCache | None = None) -> None:
+        self.client = client
+        self.base_url = self.client.base_url
+        self.cache = cache or ChatCache(
+            maxsize=int(os.environ.get("CHAT_CACHE_SIZE", 4096)),
+            ttl=float(os.environ.get("CHAT_CACHE_TTL", 600)),
+            backend=shared.get_backend(),
         )
+
+    async def create_chat(self, chat_id: int | str) -> dict:
+        """Create chat object with default options."""
+        data = {
+            "chat_id": str(chat_id),
+            "client": "TELEGRAM",
+        }
+        r = await self.client.post("chats/", json=data)
         r.raise_for_status()
+        chat = r.json()
+        self.cache.set(chat_id, chat)
+        return chat
 
-    def set_default_pool(self, chat_id: int, pool: str) -> None:
-        """Set the default pool using pool ticker."""
-        # make sure chat is registered in database, otherwise create one
-        self.get_or_create_chat(chat_id)
+    async def get_or_create_chat(self, chat_id: int) -> dict:
+        """Returns chat object from cache or database, creating it if needed."""
+        chat = self.cache.get(chat_id)
+        if chat is not None:
+            return chat
+
+        with tracing.span("chat.fetch", chat_id=chat_id):
+            endpoint = f"chats/{chat_id}/"
+            r = await self.client.get(endpoint, params={"client_filter": "TELEGRAM"})
+            if r.status_code == 404 and "not found" in r.json()["detail"].lower():
+                return await self.create_chat(chat_id)
+
+            r.raise_for_status()
+            chat = r.json()
+            self.cache.set(chat_id, chat)
+            return chat
 
+    async def iter_chats(
+        self, page_size: int = 500, exclude_groups: bool = True
+    ) -> AsyncIterator[dict]:
+        """Yield every telegram chat object, one API page at a time.
+
+        See `CardabotDB.iter_chats`.
+        """
+        params = {"client_filter": "TELEGRAM", "page_size": page_size}
+        if exclude_groups:
+            params["exclude_groups"] = "true"
+
+        page = 1
+        while True:
+            r = await self.client.get("chats/", params={**params, "page": page})
+            r.raise_for_status()
+            data = r.json()
+            chats = data if isinstance(data, list) else data.get("results", [])
+            for chat in chats:
+                if not exclude_groups or int(chat.get("chat_id")) > 0:
+                    yield chat
+
+            if isinstance(data, list) or not data.get("next") or not chats:
+                return
+            page += 1
+
+    async def get_chat_default_pool(self, chat_id: int) -> str:
+        res = await self.get_or_create_chat(chat_id)
+        return res["default_pool_id"]
+
+    async def get_chat_language(self, chat_id: int) -> str:
+        res = await self.get_or_create_chat(chat_id)
+        return res["default_language"]
+
+    async def _update_chat(self, chat_id: int, data: dict) -> None:
+        """Patch chat settings and write the change through to the cache."""
         endpoint = f"chats/{chat_id}/"
-        url = os.path.join(self.base_url, endpoint)
-        data = {"default_pool_id": pool}
-        r = requests.patch(
-            url, json=data, headers=self.headers, params={"client_filter": "TELEGRAM"}
-        )
+        params = {"client_filter": "TELEGRAM"}
+        r = await self.client.patch(endpoint, json=data, params=params)
+        if r.status_code == 404:
+            # chat is not registered in database yet, create one and try again
+            await self.create_chat(chat_id)
+            r = await self.client.patch(endpoint, json=data, params=params)
+
+        if not r.ok:
+            self.cache.invalidate(chat_id)
         r.raise_for_status()
+        self.cache.update(chat_id, data)
+
+    async def set_chat_language(self, chat_id: int, lang: str) -> None:
+        """Set chat default language."""
+        await self._update_chat(chat_id, {"default_language": lang})
+
+    async def set_default_pool(self, chat_id: int, pool: str) -> None:
+        """Set the default pool using pool ticker."""
+        await self._update_chat(chat_id, {"default_pool_id": pool})
+
+    def cache_stats(self) -> dict:
+        """Return hit/miss counters of the chat settings cache."""
+        return self.cache.stats()
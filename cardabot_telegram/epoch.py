@@ -0,0 +1,115 @@
+"""Cardano epoch clock, derived locally from the Shelley genesis parameters.
+
+Since Shelley, slots last one second and epochs 432000 slots (five days), so epoch
+boundaries follow from the first Shelley slot by plain arithmetic, without asking
+the CardaBot API. `EpochClock.reconcile` compares the clock with the API, to catch a
+misconfigured network.
+
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Genesis:
+    """Start of the Shelley era of a network and its slot parameters."""
+
+    start_epoch: int
+    start_slot: int
+    start_time: float  # unix time of `start_slot`
+    slot_length: float = 1.0  # seconds
+    epoch_length: int = 432000  # slots
+
+
+NETWORKS = {
+    # epoch 208 started at slot 4492800, on 2020-07-29T21:44:51Z
+    "mainnet": Genesis(start_epoch=208, start_slot=4492800, start_time=1596059091),
+    # epoch 74 started at slot 1598400, on 2020-07-28T20:20:16Z
+    "testnet": Genesis(start_epoch=74, start_slot=1598400, start_time=1595967616),
+}
+
+
+class EpochClock:
+    """Current slot and epoch, and epoch boundaries, of a network."""
+
+    def __init__(self, genesis: Genesis, tolerance: float | None = None) -> None:
+        self.genesis = genesis
+        # drift from the API (seconds) tolerated before the clock is corrected
+        if tolerance is None:
+            tolerance = float(os.environ.get("EPOCH_DRIFT_TOLERANCE", 60))
+        self.tolerance = tolerance
+        self.offset = 0.0  # seconds, set by `reconcile`
+
+    @property
+    def epoch_duration(self) -> float:
+        """Return epoch length in seconds."""
+        return self.genesis.epoch_length * self.genesis.slot_length
+
+    def slot(self, now: float | None = None) -> int:
+        """Return the absolute slot number at `now` (default: current time)."""
+        now = time.time() if now is None else now
+        elapsed = now - self.offset - self.genesis.start_time
+        return self.genesis.start_slot + int(elapsed // self.genesis.slot_length)
+
+    def epoch(self, now: float | None = None) -> int:
+        """Return the epoch number at `now` (default: current time)."""
+        slots = self.slot(now) - self.genesis.start_slot
+        return self.genesis.start_epoch + slots // self.genesis.epoch_length
+
+    def epoch_start(self, epoch: int) -> float:
+        """Return the unix time at which `epoch` starts."""
+        epochs = epoch - self.genesis.start_epoch
+        return self.genesis.start_time + self.offset + epochs * self.epoch_duration
+
+    def next_boundary(self, now: float | None = None) -> float:
+        """Return the unix time at which the current epoch ends."""
+        return self.epoch_start(self.epoch(now) + 1)
+
+    def remaining_time(self, now: float | None = None) -> float:
+        """Return the seconds left in the current epoch."""
+        now = time.time() if now is None else now
+        return self.next_boundary(now) - now
+
+    def reconcile(
+        self, epoch: int, remaining_time: float, now: float | None = None
+    ) -> float:
+        """Compare the clock with the epoch and remaining time reported by the API.
+
+        If they disagree by more than `tolerance` seconds, the clock adopts the API's
+        boundary (and logs a warning, since this hints at a misconfigured network).
+
+        Returns:
+            The correction applied to the epoch boundaries, in seconds (0 if none).
+
+        """
+        now = time.time() if now is None else now
+        drift = (now + remaining_time) - self.epoch_start(epoch + 1)
+        if abs(drift) <= self.tolerance:
+            return 0.0
+
+        logging.warning(
+            "Epoch clock is %.0fs off the CardaBot API (epoch %s), adjusting it",
+            drift,
+            epoch,
+        )
+        self.offset += drift
+        return drift
+
+
+_clocks: dict[str, EpochClock] = {}
+_clocks_lock = threading.Lock()
+
+
+def get_clock(network: str | None = None) -> EpochClock:
+    """Return the shared clock of a network (default: the `NETWORK` env variable)."""
+    network = (network or os.environ.get("NETWORK", "mainnet")).lower()
+    if network not in NETWORKS:
+        raise ValueError("Invalid network environment variable!")
+
+    with _clocks_lock:
+        if network not in _clocks:
+            _clocks[network] = EpochClock(NETWORKS[network])
+        return _clocks[network]
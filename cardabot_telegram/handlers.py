@@ -0,0 +1,44 @@
+"""Register the bot commands on a dispatcher."""
+from telegram.ext import CommandHandler, Dispatcher
+
+# (command, callback name, run_async)
+COMMANDS = [
+    ("start", "start", True),
+    ("pool", "pool_info", True),
+    ("language", "change_language", True),
+    ("setpool", "change_default_pool", True),
+    ("help", "help", True),
+    ("ebs", "ebs", True),
+    ("tip", "tip", True),
+    ("epoch", "epoch_info", True),
+    ("pots", "pots", True),
+    ("netparams", "netparams", True),
+    ("netstats", "netstats", True),
+    ("connect", "connect", True),
+    ("alert", "alert", True),
+    ("claim", "claim", True),
+    ("balance", "balance", True),
+    ("broadcasts", "broadcast_status", True),
+    ("profile", "profile_commands", True),
+]
+
+
+def register(dispatcher: Dispatcher, cbs, async_commands=frozenset(), wrap=None):
+    """Add a command handler for every bot command.
+
+    Args:
+        dispatcher: the updater's dispatcher.
+        cbs: a `CardaBotCallbacks` (or `AsyncCardaBotCallbacks`) instance.
+        async_commands: callbacks that only schedule a coroutine, which are run
+            directly by the dispatcher instead of on its worker pool.
+        wrap: optional `wrap(command, callback)` returning the callback to register
+            (e.g. to time commands in benchmarks).
+
+    """
+    for command, name, run_async in COMMANDS:
+        if name in async_commands:
+            run_async = False  # the callback only schedules a coroutine
+        callback = getattr(cbs, name)
+        if wrap is not None:
+            callback = wrap(command, callback)
+        dispatcher.add_handler(CommandHandler(command, callback, run_async=run_async))
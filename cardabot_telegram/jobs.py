@@ -0,0 +1,332 @@
+"""Persistent, resumable broadcast jobs."""
+import itertools
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterable
+from contextlib import contextmanager
+
+from . import broadcast, shared, storage, suppression
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    text TEXT NOT NULL,
+    parse_mode TEXT,
+    status TEXT NOT NULL DEFAULT 'enumerating',
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS broadcast_variants (
+    job_id INTEGER NOT NULL REFERENCES broadcast_jobs (id),
+    language TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (job_id, language)
+);
+CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+    job_id INTEGER NOT NULL REFERENCES broadcast_jobs (id),
+    chat_id TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    updated_at REAL,
+    language TEXT,
+    PRIMARY KEY (job_id, chat_id)
+);
+CREATE INDEX IF NOT EXISTS broadcast_deliveries_state
+    ON broadcast_deliveries (job_id, state);
+"""
+
+MIGRATIONS = {
+    # table: {column: definition} added after the table was first released
+    "broadcast_deliveries": {"language": "TEXT"},
+}
+
+# job status: recipients are still being listed, only sending is left, or finished
+ENUMERATING, SENDING, DONE = "enumerating", "sending", "done"
+
+# delivery state: "sending" is set right before the message is sent, so a delivery
+# interrupted by a restart becomes "unknown" and is never sent twice
+PENDING, IN_FLIGHT, UNKNOWN = "pending", "sending", "unknown"
+
+
+class BroadcastJobStore:
+    """SQLite store of broadcast jobs and per-recipient delivery state."""
+
+    def __init__(self, path: str | None = None) -> None:
+        self._conn = storage.connect(path)
+        self._lock = threading.RLock()
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        for table, columns in MIGRATIONS.items():
+            existing = {
+                row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")
+            }
+            for column, definition in columns.items():
+                if column not in existing:
+                    self._conn.execute(
+                        f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
+                    )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def create_job(
+        self,
+        kind: str,
+        text: str,
+        parse_mode: str | None,
+        variants: dict[str, str] | None = None,
+    ) -> int:
+        """Create a job; `variants` map languages to a translated message text."""
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "INSERT INTO broadcast_jobs (kind, text, parse_mode, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (kind, text, parse_mode, time.time()),
+            )
+            conn.executemany(
+                "INSERT INTO broadcast_variants (job_id, language, text) "
+                "VALUES (?, ?, ?)",
+                ((cur.lastrowid, lang, v) for lang, v in (variants or {}).items()),
+            )
+            return cur.lastrowid
+
+    def get_variants(self, job_id: int) -> dict[str, str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT language, text FROM broadcast_variants WHERE job_id = ?",
+                (job_id,),
+            ).fetchall()
+        return {row["language"]: row["text"] for row in rows}
+
+    def get_job(self, job_id: int) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return dict(row)
+
+    def set_status(self, job_id: int, status: str) -> None:
+        finished_at = time.time() if status == DONE else None
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE broadcast_jobs SET status = ?, finished_at = ? WHERE id = ?",
+                (status, finished_at, job_id),
+            )
+
+    def unfinished_jobs(self) -> list[int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM broadcast_jobs WHERE status != ? ORDER BY id", (DONE,)
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def recent_jobs(self, limit: int = 5) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM broadcast_jobs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def add_recipients(
+        self, job_id: int, recipients: Iterable[tuple[int | str, str | None]]
+    ) -> None:
+        """Register (chat_id, language) recipients; known chats are ignored."""
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO broadcast_deliveries "
+                "(job_id, chat_id, language) VALUES (?, ?, ?)",
+                ((job_id, str(chat_id), lang) for chat_id, lang in recipients),
+            )
+
+    def pending_languages(self, job_id: int) -> list[str | None]:
+        """Return the languages of the recipients still waiting for the message."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT language FROM broadcast_deliveries "
+                "WHERE job_id = ? AND state = ?",
+                (job_id, PENDING),
+            ).fetchall()
+        return [row["language"] for row in rows]
+
+    def pending(self, job_id: int, language: str | None, limit: int) -> list[str]:
+        """Return up to `limit` recipients of a language waiting for the message."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chat_id FROM broadcast_deliveries "
+                "WHERE job_id = ? AND state = ? AND language IS ? LIMIT ?",
+                (job_id, PENDING, language, limit),
+            ).fetchall()
+        return [row["chat_id"] for row in rows]
+
+    def mark(self, job_id: int, chat_id: int | str, state: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE broadcast_deliveries SET state = ?, updated_at = ? "
+                "WHERE job_id = ? AND chat_id = ?",
+                (state, time.time(), job_id, str(chat_id)),
+            )
+
+    def recover(self, job_id: int) -> int:
+        """Flag deliveries interrupted mid-send as unknown, so they aren't resent."""
+        with self._transaction() as conn:
+            cur = conn.execute(
+                "UPDATE broadcast_deliveries SET state = ? "
+                "WHERE job_id = ? AND state = ?",
+                (UNKNOWN, job_id, IN_FLIGHT),
+            )
+            return cur.rowcount
+
+    def progress(self, job_id: int) -> dict[str, int]:
+        """Return the number of recipients in each delivery state."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT state, COUNT(*) AS n FROM broadcast_deliveries "
+                "WHERE job_id = ? GROUP BY state",
+                (job_id,),
+            ).fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> BroadcastJobStore:
+    """Return the process-wide broadcast job store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BroadcastJobStore()
+        return _store
+
+
+def chunked(iterable: Iterable, size: int):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+class BroadcastJobRunner:
+    """Run broadcast jobs chunk by chunk, recording every delivery in the store.
+
+    Recipients are read from `audience` (a callable returning an iterable of
+    (chat_id, language) pairs) and sending starts after the first chunk is stored, so
+    memory use does not depend on the audience size. A job interrupted by a restart
+    can be resumed with `run`: recipients are listed again if needed and only pending
+    ones are sent.
+
+    Jobs may carry one pre-rendered text per language. Recipients are grouped by
+    language and get their variant, or the job's default text if there is none.
+
+    A job is run by one worker at a time: the one holding its lease (`broadcast:<id>`
+    in the shared backend), renewed before every chunk. A worker that lost the lease
+    (e.g. it stalled for longer than `lease_ttl`) stops sending.
+
+    """
+
+    chunk_size = 500
+    lease_ttl = 300  # seconds, much longer than sending a chunk
+
+    def __init__(
+        self,
+        bot,
+        audience: Callable[[], Iterable[tuple[int | str, str | None]]],
+        store: BroadcastJobStore | None = None,
+        backend: shared.SharedBackend | None = None,
+    ) -> None:
+        self.store = store or get_store()
+        self.backend = backend or shared.get_backend()
+        self.owner = shared.worker_id()
+        self.audience = audience
+        self.broadcaster = broadcast.Broadcaster(
+            bot,
+            dry_run=broadcast.dry_run_enabled(),
+            suppression=suppression.get_index(),
+        )
+
+    def create(
+        self,
+        kind: str,
+        text: str,
+        parse_mode: str | None = "Markdown",
+        variants: dict[str, str] | None = None,
+    ) -> int:
+        return self.store.create_job(kind, text, parse_mode, variants)
+
+    def _drain(self, job: dict) -> bool:
+        """Send the pending recipients; False if the lease was lost meanwhile."""
+
+        def claim(chat_id):
+            self.store.mark(job["id"], chat_id, IN_FLIGHT)
+
+        def record(chat_id, status):
+            self.store.mark(job["id"], chat_id, status)
+
+        variants = self.store.get_variants(job["id"])
+        for language in self.store.pending_languages(job["id"]):
+            text = variants.get(language, job["text"])
+            while chat_ids := self.store.pending(job["id"], language, self.chunk_size):
+                if not self._lease(job["id"]):  # renew
+                    logging.warning("Broadcast %s: lease lost, stopping", job["id"])
+                    return False
+                self.broadcaster.send(
+                    chat_ids,
+                    text,
+                    parse_mode=job["parse_mode"],
+                    on_send=claim,
+                    on_result=record,
+                )
+        return True
+
+    def _lease(self, job_id: int) -> bool:
+        """Take or renew the ownership of a job; False if another worker has it."""
+        return self.backend.acquire(f"broadcast:{job_id}", self.owner, self.lease_ttl)
+
+    def run(self, job_id: int) -> dict[str, int]:
+        """Send (or resume sending) a job and return its final progress."""
+        job = self.store.get_job(job_id)
+        if job["status"] != DONE and not self._lease(job_id):
+            logging.info("Broadcast %s is run by another worker", job_id)
+            return self.store.progress(job_id)
+
+        if job["status"] != DONE:
+            if interrupted := self.store.recover(job_id):
+                logging.warning(
+                    "Broadcast %s: %s deliveries interrupted by a restart, "
+                    "they won't be resent",
+                    job_id,
+                    interrupted,
+                )
+
+            if job["status"] == ENUMERATING:
+                for recipients in chunked(self.audience(), self.chunk_size):
+                    self.store.add_recipients(job_id, recipients)
+                    if not self._drain(job):
+                        return self.store.progress(job_id)
+                self.store.set_status(job_id, SENDING)
+
+            if not self._drain(job):
+                return self.store.progress(job_id)
+            self.store.set_status(job_id, DONE)
+            self.backend.release(f"broadcast:{job_id}", self.owner)
+
+        progress = self.store.progress(job_id)
+        logging.info("Broadcast %s finished: %s", job_id, progress)
+        return progress
+
+    def resume_all(self) -> None:
+        """Resume every unfinished job, one after the other."""
+        for job_id in self.store.unfinished_jobs():
+            logging.info("Resuming broadcast %s", job_id)
+            self.run(job_id)
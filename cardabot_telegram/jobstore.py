@@ -0,0 +1,135 @@
+"""APScheduler job store persisting jobs in the local SQLite database.
+
+Jobs added to this store survive restarts, so their function must be referenced by
+name (a module-level function) and their arguments must be picklable: pass ids, not
+`telegram.Bot` or `Message` objects.
+
+"""
+import pickle
+import sqlite3
+import threading
+
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+from . import storage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scheduler_jobs (
+    id TEXT PRIMARY KEY,
+    next_run_time REAL,
+    job_state BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scheduler_jobs_next_run_time
+    ON scheduler_jobs (next_run_time);
+"""
+
+
+class SQLiteJobStore(BaseJobStore):
+    """Same table layout and semantics as APScheduler's `SQLAlchemyJobStore`."""
+
+    def __init__(self, path: str | None = None) -> None:
+        super().__init__()
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def start(self, scheduler, alias) -> None:
+        super().start(scheduler, alias)
+        self._conn = storage.connect(self.path)
+        self._conn.executescript(SCHEMA)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _execute(self, sql: str, params=()) -> list | int:
+        """Run a statement; return its rows, or the number of rows it changed."""
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            return cursor.fetchall() if cursor.description else cursor.rowcount
+
+    def lookup_job(self, job_id):
+        rows = self._execute(
+            "SELECT job_state FROM scheduler_jobs WHERE id = ?", (job_id,)
+        )
+        return self._reconstitute_job(rows[0]["job_state"]) if rows else None
+
+    def get_due_jobs(self, now):
+        return self._get_jobs(
+            "WHERE next_run_time <= ?", (datetime_to_utc_timestamp(now),)
+        )
+
+    def get_next_run_time(self):
+        rows = self._execute(
+            "SELECT next_run_time FROM scheduler_jobs WHERE next_run_time IS NOT NULL "
+            "ORDER BY next_run_time LIMIT 1"
+        )
+        return utc_timestamp_to_datetime(rows[0]["next_run_time"]) if rows else None
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job) -> None:
+        next_run_time = datetime_to_utc_timestamp(job.next_run_time)
+        try:
+            self._execute(
+                "INSERT INTO scheduler_jobs (id, next_run_time, job_state) "
+                "VALUES (?, ?, ?)",
+                (job.id, next_run_time, self._dumps(job)),
+            )
+        except sqlite3.IntegrityError:
+            raise ConflictingIdError(job.id)
+
+    def update_job(self, job) -> None:
+        updated = self._execute(
+            "UPDATE scheduler_jobs SET next_run_time = ?, job_state = ? WHERE id = ?",
+            (datetime_to_utc_timestamp(job.next_run_time), self._dumps(job), job.id),
+        )
+        if not updated:
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id) -> None:
+        if not self._execute("DELETE FROM scheduler_jobs WHERE id = ?", (job_id,)):
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self) -> None:
+        self._execute("DELETE FROM scheduler_jobs")
+
+    @staticmethod
+    def _dumps(job) -> bytes:
+        return pickle.dumps(job.__getstate__(), pickle.HIGHEST_PROTOCOL)
+
+    def _reconstitute_job(self, job_state: bytes):
+        job_state = pickle.loads(job_state)
+        job_state["jobstore"] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, where: str = "", params=()) -> list:
+        jobs, failed = [], []
+        rows = self._execute(
+            f"SELECT id, job_state FROM scheduler_jobs {where} ORDER BY next_run_time",
+            params,
+        )
+        for row in rows:
+            try:
+                jobs.append(self._reconstitute_job(row["job_state"]))
+            except BaseException:
+                self._logger.exception("Can't restore job %s, removing it", row["id"])
+                failed.append(row["id"])
+
+        for job_id in failed:
+            self._execute("DELETE FROM scheduler_jobs WHERE id = ?", (job_id,))
+        return jobs
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} (path={self.path or storage.db_path()})>"
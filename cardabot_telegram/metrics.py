@@ -0,0 +1,292 @@
+"""Per-command instrumentation, exported in the Prometheus text format.
+
+Every command runs inside `command(name)`, which collects where its time went: wall
+time, time spent in CardaBot API calls and in Telegram requests, template rendering,
+and the number of upstream calls and cache hits. The API client, the caches, the
+templates and `InstrumentedBot` report into the command running in the current
+context through `record_*` functions; outside of a command (broadcasts, watcher
+checks) only the process-wide metrics are updated.
+
+The metrics are served at `METRICS_PATH` (default: /metrics) next to the webhook,
+see `register`.
+
+"""
+import contextlib
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextvars import ContextVar
+
+import tornado.web
+from telegram import Bot
+
+from . import tracing
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = (f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, value: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Histogram:
+    def __init__(
+        self, name: str, doc: str, labels: tuple[str, ...] = (), buckets=BUCKETS
+    ) -> None:
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._values: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            counts = self._values.setdefault(labels, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            return self._values.get(labels, [0, 0])[-2]
+
+    def sum(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, [0, 0])[-1]
+
+    def names(self) -> list[str]:
+        """Return the first label of every observed series."""
+        with self._lock:
+            return [labels[0] for labels in self._values if labels]
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            for labels, counts in sorted(self._values.items()):
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    bucket_labels = _labels((*self.labels, "le"), (*labels, bound))
+                    yield f"{self.name}_bucket{bucket_labels} {count}"
+                yield f"{self.name}_count{_labels(self.labels, labels)} {counts[-2]}"
+                yield f"{self.name}_sum{_labels(self.labels, labels)} {counts[-1]}"
+
+
+COMMANDS = Counter(
+    "cardabot_commands_total", "Commands handled.", ("command", "status")
+)
+COMMAND_SECONDS = Histogram(
+    "cardabot_command_seconds", "Wall time of commands.", ("command",)
+)
+COMMAND_API_SECONDS = Histogram(
+    "cardabot_command_api_seconds",
+    "Time spent in CardaBot API calls per command (summed over concurrent calls).",
+    ("command",),
+)
+COMMAND_TELEGRAM_SECONDS = Histogram(
+    "cardabot_command_telegram_seconds",
+    "Time spent in Telegram requests per command.",
+    ("command",),
+)
+COMMAND_RENDER_SECONDS = Histogram(
+    "cardabot_command_render_seconds",
+    "Time spent rendering reply templates per command.",
+    ("command",),
+)
+COMMAND_API_CALLS = Counter(
+    "cardabot_command_api_calls_total",
+    "CardaBot API requests made by commands.",
+    ("command",),
+)
+COMMAND_CACHE_HITS = Counter(
+    "cardabot_command_cache_hits_total",
+    "Chat and response cache hits of commands.",
+    ("command",),
+)
+API_SECONDS = Histogram(
+    "cardabot_api_request_seconds", "CardaBot API request time.", ("method",)
+)
+TELEGRAM_SECONDS = Histogram(
+    "cardabot_telegram_request_seconds", "Telegram Bot API request time.", ("method",)
+)
+CACHE = Counter("cardabot_cache_lookups_total", "Cache lookups.", ("cache", "result"))
+THROTTLED = Counter(
+    "cardabot_throttled_commands_total",
+    "Commands turned away by the throttle.",
+    ("reason",),
+)
+
+REGISTRY = [
+    COMMANDS,
+    COMMAND_SECONDS,
+    COMMAND_API_SECONDS,
+    COMMAND_TELEGRAM_SECONDS,
+    COMMAND_RENDER_SECONDS,
+    COMMAND_API_CALLS,
+    COMMAND_CACHE_HITS,
+    API_SECONDS,
+    TELEGRAM_SECONDS,
+    CACHE,
+    THROTTLED,
+]
+
+
+class CommandStats:
+    """Time and calls spent by one command, filled from any thread it uses."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.api_seconds = 0.0
+        self.api_calls = 0
+        self.telegram_seconds = 0.0
+        self.telegram_calls = 0
+        self.render_seconds = 0.0
+        self.cache_hits = 0
+        self.failed = False  # set by handlers that catch their own errors
+        self._lock = threading.Lock()
+
+    def add(self, **values: float) -> None:
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, getattr(self, name) + value)
+
+
+_current: ContextVar[CommandStats | None] = ContextVar("command_stats", default=None)
+
+
+def current() -> CommandStats | None:
+    """Return the stats of the command running in this context, if any."""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def command(name: str) -> Iterator[CommandStats]:
+    """Instrument a command; nested blocks report into the outermost command."""
+    if _current.get() is not None:
+        yield _current.get()
+        return
+
+    stats = CommandStats(name)
+    token = _current.set(stats)
+    start = time.perf_counter()
+    completed = False
+    try:
+        yield stats
+        completed = True
+    finally:
+        _current.reset(token)
+        COMMANDS.inc(name, "ok" if completed and not stats.failed else "error")
+        COMMAND_SECONDS.observe(time.perf_counter() - start, name)
+        COMMAND_API_SECONDS.observe(stats.api_seconds, name)
+        COMMAND_TELEGRAM_SECONDS.observe(stats.telegram_seconds, name)
+        COMMAND_RENDER_SECONDS.observe(stats.render_seconds, name)
+        COMMAND_API_CALLS.inc(name, value=stats.api_calls)
+        COMMAND_CACHE_HITS.inc(name, value=stats.cache_hits)
+
+
+def record_api(method: str, seconds: float) -> None:
+    API_SECONDS.observe(seconds, method)
+    stats = _current.get()
+    if stats is not None:
+        stats.add(api_seconds=seconds, api_calls=1)
+
+
+def record_telegram(method: str, seconds: float) -> None:
+    TELEGRAM_SECONDS.observe(seconds, method)
+    stats = _current.get()
+    if stats is not None:
+        stats.add(telegram_seconds=seconds, telegram_calls=1)
+
+
+def record_render(seconds: float) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.add(render_seconds=seconds)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE.inc(cache, "hit" if hit else "miss")
+    stats = _current.get()
+    if hit and stats is not None:
+        stats.add(cache_hits=1)
+
+
+def render() -> str:
+    """Return every metric in the Prometheus text exposition format."""
+    lines = [line for metric in REGISTRY for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+class InstrumentedBot(Bot):
+    """`telegram.Bot` timing and tracing Bot API requests (long polling excluded)."""
+
+    def _post(self, endpoint: str, *args, **kwargs):
+        if endpoint == "getUpdates":
+            return super()._post(endpoint, *args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            with tracing.span("telegram", method=endpoint):
+                return super()._post(endpoint, *args, **kwargs)
+        finally:
+            record_telegram(endpoint, time.perf_counter() - start)
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self) -> None:
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(render())
+
+
+def register(updater) -> str | None:
+    """Serve the metrics next to the updater's webhook.
+
+    Must be called after `updater.start_webhook`. The endpoint is only enabled when
+    `METRICS_ENABLED` is true; its path is `METRICS_PATH`.
+
+    Returns:
+        The endpoint path, or None if metrics are disabled.
+
+    """
+    if os.environ.get("METRICS_ENABLED", "").lower() != "true":
+        return None
+
+    path = os.environ.get("METRICS_PATH", "/metrics")
+    app = updater.httpd.http_server.request_callback
+    updater.httpd.loop.add_callback(app.add_handlers, r".*$", [(path, MetricsHandler)])
+    return path
@@ -0,0 +1,70 @@
+"""Receive push notifications from the CardaBot API.
+
+The API can POST to the notification endpoint when a transaction is submitted or a
+wallet gets connected, so the pending watch is checked right away instead of waiting
+for the next poll. Polling remains as the fallback.
+
+Payloads are JSON objects, authenticated by the `X-CardaBot-Token` header:
+
+    {"event": "tx_submitted", "tx_id": "<tx id>"}
+    {"event": "wallet_connected", "chat_id": "<telegram chat id>"}
+
+"""
+import hmac
+import json
+import logging
+import os
+
+import tornado.web
+
+from . import watcher
+
+EVENT_KEYS = {
+    "tx_submitted": ("tx_id", "tx:{}"),
+    "wallet_connected": ("chat_id", "connect:{}"),
+}
+
+
+class NotificationHandler(tornado.web.RequestHandler):
+    def initialize(self, token: str) -> None:
+        self.token = token
+
+    def post(self) -> None:
+        received = self.request.headers.get("X-CardaBot-Token", "")
+        if not hmac.compare_digest(received.encode(), self.token.encode()):
+            raise tornado.web.HTTPError(403)
+
+        try:
+            payload = json.loads(self.request.body)
+            field, key_format = EVENT_KEYS[payload["event"]]
+            key = key_format.format(payload[field])
+        except (ValueError, KeyError, TypeError):
+            raise tornado.web.HTTPError(400)
+
+        # the check itself runs on the watcher pool, off the webhook io loop
+        if not watcher.get_watcher().trigger(key):
+            raise tornado.web.HTTPError(404)
+
+        logging.info("Notification received: %s", key)
+        self.set_status(202)
+
+
+def register(updater) -> str | None:
+    """Serve the notification endpoint next to the updater's webhook.
+
+    Must be called after `updater.start_webhook`. The endpoint is only enabled when
+    `CARDABOT_NOTIFY_TOKEN` is set; its path is `NOTIFY_PATH`.
+
+    Returns:
+        The endpoint path, or None if notifications are disabled.
+
+    """
+    token = os.environ.get("CARDABOT_NOTIFY_TOKEN")
+    if not token:
+        return None
+
+    path = os.environ.get("NOTIFY_PATH", "/cardabot/notify")
+    app = updater.httpd.http_server.request_callback
+    handlers = [(path, NotificationHandler, {"token": token})]
+    updater.httpd.loop.add_callback(app.add_handlers, r".*$", handlers)
+    return path
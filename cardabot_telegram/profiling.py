@@ -0,0 +1,204 @@
+"""Opt-in profiling of live commands and scheduler jobs.
+
+An admin starts a profiling session with `/profile on <n>` (or `PROFILE_COMMANDS=<n>`
+at startup): the next `n` commands are profiled, as well as the scheduler jobs and
+watch checks that run meanwhile. Profiles are aggregated and dumped to `PROFILE_DIR`
+(default: profiles) when the session ends:
+
+- cProfile (default): `profile-<time>.pstats`, loadable with `pstats` or snakeviz,
+  and `profile-<time>.txt` with the top functions by cumulative time.
+- pyinstrument (`PROFILER=pyinstrument`, optional dependency): a sampling profile,
+  dumped as `profile-<time>.html` and `.txt` call trees.
+
+Only one profile runs per thread at a time. In async mode, the profile of a command
+also covers the other coroutines running on the loop meanwhile.
+
+"""
+import contextlib
+import cProfile
+import functools
+import importlib.util
+import logging
+import os
+import pstats
+import threading
+import time
+from collections.abc import Iterator
+
+
+class Profiler:
+    def __init__(self, directory: str | None = None, backend: str | None = None):
+        self.directory = directory or os.environ.get("PROFILE_DIR", "profiles")
+        self.backend = backend or os.environ.get("PROFILER", "cprofile").lower()
+        if self.backend not in ("cprofile", "pyinstrument"):
+            raise ValueError(f"Unknown profiler: {self.backend}")
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._remaining = 0  # commands left to profile in the current session
+        self._running = 0
+        self._profiled = 0
+        self._aggregate = None  # pstats.Stats or pyinstrument Session
+
+    def status(self) -> str:
+        with self._lock:
+            if not self._remaining and not self._running:
+                return "off"
+            if not self._remaining:
+                return (
+                    f"stopping ({self.backend}): report dumped when the "
+                    f"{self._running} running profiles finish"
+                )
+            return (
+                f"on ({self.backend}): {self._profiled} profiled, "
+                f"{self._remaining} commands left"
+            )
+
+    def start(self, commands: int) -> None:
+        """Profile the next `commands` commands."""
+        if self.backend == "pyinstrument" and not importlib.util.find_spec(
+            "pyinstrument"
+        ):
+            raise ModuleNotFoundError("PROFILER=pyinstrument requires pyinstrument")
+
+        with self._lock:
+            self._remaining = commands
+        logging.info("Profiling the next %s commands (%s)", commands, self.backend)
+
+    def stop(self) -> str | None:
+        """End the session; return the path of the dumped report, if any."""
+        with self._lock:
+            self._remaining = 0
+            if self._running:
+                return None  # dumped when the last running profile finishes
+            return self._dump()
+
+    @contextlib.contextmanager
+    def profile(self, name: str, command: bool = True) -> Iterator[None]:
+        """Profile the block if a session is active.
+
+        Args:
+            name: what is being profiled (for the logs).
+            command: whether the block is a command, counted against the session
+                (scheduler jobs and watch checks are not).
+
+        """
+        enabled = False
+        if self._remaining > 0 and not getattr(self._local, "busy", False):
+            with self._lock:
+                enabled = self._remaining > 0
+                if enabled:
+                    self._remaining -= int(command)
+                    self._running += 1
+        if not enabled:
+            yield
+            return
+
+        self._local.busy = True
+        profiler = self._new_profiler()
+        try:
+            yield
+        finally:
+            result = self._stop_profiler(profiler)
+            self._local.busy = False
+            with self._lock:
+                self._add(result)
+                self._running -= 1
+                self._profiled += 1
+                if not self._remaining and not self._running:
+                    self._dump()
+            logging.debug("Profiled %s", name)
+
+    def _new_profiler(self):
+        if self.backend == "pyinstrument":
+            from pyinstrument import Profiler as SamplingProfiler
+
+            profiler = SamplingProfiler(async_mode="disabled")
+            profiler.start()
+            return profiler
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _stop_profiler(self, profiler):
+        if self.backend == "pyinstrument":
+            return profiler.stop()
+
+        profiler.disable()
+        return profiler
+
+    def _add(self, result) -> None:
+        if self.backend == "pyinstrument":
+            from pyinstrument.session import Session
+
+            if self._aggregate is not None:
+                result = Session.combine(self._aggregate, result)
+            self._aggregate = result
+        elif self._aggregate is None:
+            self._aggregate = pstats.Stats(result)
+        else:
+            self._aggregate.add(result)
+
+    def _dump(self) -> str | None:
+        """Write the aggregated report and reset it (called with the lock held)."""
+        aggregate, self._aggregate = self._aggregate, None
+        profiled, self._profiled = self._profiled, 0
+        if aggregate is None:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, time.strftime("profile-%Y%m%d-%H%M%S"))
+        if self.backend == "pyinstrument":
+            from pyinstrument.renderers import ConsoleRenderer, HTMLRenderer
+
+            with open(path + ".html", "w") as f:
+                f.write(HTMLRenderer().render(aggregate))
+            with open(path + ".txt", "w") as f:
+                f.write(ConsoleRenderer(unicode=False, color=False).render(aggregate))
+        else:
+            aggregate.dump_stats(path + ".pstats")
+            with open(path + ".txt", "w") as f:
+                aggregate.stream = f
+                aggregate.sort_stats("cumulative").print_stats(60)
+
+        logging.info("Profile of %s calls written to %s", profiled, path)
+        return path
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> Profiler:
+    """Return the process-wide profiler, started if `PROFILE_COMMANDS` is set."""
+    global _profiler
+    if _profiler is not None:
+        return _profiler
+
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = Profiler()
+            commands = int(os.environ.get("PROFILE_COMMANDS", 0))
+            if commands:
+                _profiler.start(commands)
+        return _profiler
+
+
+def profile(name: str, command: bool = True):
+    """Profile a block with the process-wide profiler (context manager)."""
+    return get_profiler().profile(name, command)
+
+
+def job(name: str):
+    """Decorator profiling a scheduler job while a session is active."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile(name, command=False):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
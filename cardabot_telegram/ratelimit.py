@@ -0,0 +1,102 @@
+"""Token bucket rate limiters."""
+import threading
+import time
+
+from cachetools import TTLCache
+
+
+class TokenBucket:
+    """Thread-safe token bucket.
+
+    Holds up to `capacity` tokens and refills at `rate` tokens per second.
+
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(now - max(self._updated, self._paused_until), 0)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = max(now, self._updated)
+
+    def _wait_time(self, tokens: float) -> float:
+        """Take tokens and return 0, or return how long to wait for them."""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        self._refill(now)
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return 0
+        return (tokens - self._tokens) / self.rate
+
+    def available(self, tokens: float = 1) -> bool:
+        """Return True if tokens could be taken right now, without taking them."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return False
+            self._refill(now)
+            return self._tokens >= tokens
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens if they are available right now, without blocking."""
+        with self._lock:
+            return self._wait_time(tokens) == 0
+
+    def acquire(self, tokens: float = 1, timeout: float | None = None) -> bool:
+        """Block until tokens are available.
+
+        Returns False if they could not be acquired within `timeout` seconds.
+
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                wait = self._wait_time(tokens)
+            if wait == 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for the given time (e.g. after a flood error)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+class KeyedTokenBuckets:
+    """Independent token buckets per key (e.g. per chat), created on demand.
+
+    Buckets idle for longer than `ttl` seconds are dropped, keeping memory bounded.
+
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float | None = None,
+        maxsize: int = 65536,
+        ttl: float = 600,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.capacity)
+            self._buckets[key] = bucket  # refresh ttl on every use
+            return bucket
@@ -1,35 +1,196 @@
 """Manage HTML bot replies."""
 import os
+import string
+import threading
+import time
+
+from . import metrics, tracing
+
+
+class TemplateError(ValueError):
+    """Raised when the templates directory contains a broken template."""
+
+
+class TemplateRegistry:
+    """In-memory registry of every HTML template, keyed by (language, template).
+
+    The whole templates tree is read once and validated: templates must be valid
+    format strings, and translations must use exactly the same placeholders as the
+    default language version. Language fallback is resolved at load time, so every
+    (language, template) pair maps directly to the text to be rendered.
+
+    With `hot_reload` enabled, the directory is checked for changes (at most once per
+    `check_interval` seconds) and reloaded when any template is added or modified.
+
+    """
+
+    def __init__(
+        self,
+        path: str,
+        languages: tuple[str, ...],
+        default_lang: str,
+        hot_reload: bool = False,
+        check_interval: float = 1.0,
+    ) -> None:
+        self.path = path
+        self.languages = languages
+        self.default_lang = default_lang
+        self.hot_reload = hot_reload
+        self.check_interval = check_interval
+        self._templates: dict[tuple[str, str], str] = {}
+        self._signature = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def _fields(name: str, text: str) -> frozenset[str]:
+        try:
+            return frozenset(
+                field.split(".")[0].split("[")[0]
+                for _, field, _, _ in string.Formatter().parse(text)
+                if field is not None
+            )
+        except ValueError as e:
+            raise TemplateError(f"Invalid template {name}: {e}") from e
+
+    def _read_dir(self, lang: str) -> dict[str, str]:
+        lang_path = os.path.join(self.path, lang)
+        if not os.path.isdir(lang_path):
+            return {}
+
+        templates = {}
+        for html_file in os.listdir(lang_path):
+            if html_file.endswith(".html"):
+                with open(os.path.join(lang_path, html_file), encoding="utf-8") as f:
+                    templates[html_file] = f.read()
+        return templates
+
+    def _directory_signature(self) -> tuple:
+        signature = []
+        for lang in self.languages:
+            lang_path = os.path.join(self.path, lang)
+            if not os.path.isdir(lang_path):
+                continue
+            for entry in os.scandir(lang_path):
+                signature.append((lang, entry.name, entry.stat().st_mtime_ns))
+        return tuple(sorted(signature))
+
+    def load(self) -> None:
+        """(Re)load and validate all templates, replacing the current registry."""
+        signature = self._directory_signature()
+        defaults = self._read_dir(self.default_lang)
+        if not defaults:
+            raise TemplateError(
+                f"No templates found in {os.path.join(self.path, self.default_lang)}"
+            )
+
+        fields = {name: self._fields(name, text) for name, text in defaults.items()}
+        templates = {}
+        for lang in self.languages:
+            translations = self._read_dir(lang)
+            for name, text in translations.items():
+                if name not in defaults:
+                    raise TemplateError(
+                        f"Template {lang}/{name} has no {self.default_lang} version"
+                    )
+                if self._fields(name, text) != fields[name]:
+                    raise TemplateError(
+                        f"Template {lang}/{name} placeholders do not match "
+                        f"{self.default_lang}/{name}: expected {sorted(fields[name])}"
+                    )
+
+            for name, text in defaults.items():
+                templates[(lang, name)] = translations.get(name, text)
+
+        with self._lock:
+            self._templates = templates
+            self._signature = signature
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+
+        self._last_check = now
+        if self._directory_signature() != self._signature:
+            self.load()
+
+    def get(self, lang: str, html_file: str) -> str:
+        """Return the raw template text for the given language."""
+        if self.hot_reload:
+            self._maybe_reload()
+        return self._templates[(lang, html_file)]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def load_templates() -> TemplateRegistry:
+    """Load (or reload) the shared template registry.
+
+    Call it at startup so broken templates fail fast. The templates directory and
+    hot reload mode are set by the `TEMPLATES_DIR` and `TEMPLATES_HOT_RELOAD`
+    environment variables.
+
+    """
+    global _registry
+    with _registry_lock:
+        _registry = TemplateRegistry(
+            path=os.environ.get("TEMPLATES_DIR", "templates"),
+            languages=HTMLReplies.supported_languages,
+            default_lang=HTMLReplies.default_language,
+            hot_reload=os.environ.get("TEMPLATES_HOT_RELOAD", "").lower()
+            in ("1", "true", "yes"),
+        )
+        return _registry
+
+
+def get_registry() -> TemplateRegistry:
+    """Return the shared template registry, loading it on first use."""
+    if _registry is None:
+        return load_templates()
+    return _registry
 
 
 class HTMLReplies:
+    """Immutable HTML reply renderer for a single language.
+
+    Instances are shared between callbacks; use `get_replies` to obtain the one for
+    a given language instead of creating new ones.
+
+    """
+
     supported_languages = (
         "EN",  # english
         "PT",  # portuguese/brazil
         "KR",  # korean
         "JP",  # japanese
     )
+    default_language = "EN"
 
-    def __init__(self) -> None:
-        self.language = self.default_lang
+    __slots__ = ("_language",)
+
+    def __init__(self, language: str = default_language) -> None:
+        if not self.is_supported(language):
+            raise ValueError(f"Unsupported language: {language}")
+        self._language = language.upper()
+
+    @property
+    def language(self) -> str:
+        """Return the language used by this renderer."""
+        return self._language
 
     @property
     def default_lang(self) -> str:
         """Return default language."""
-        return "EN"
-
-    def set_language(self, lang: str) -> bool:
-        """Set preferred language.
-
-        Returns True if the change was successful; otherwise, return False if the
-        language is not supported and make no changes to language settings.
-
-        """
-        if lang.upper() in self.supported_languages:
-            self.language = lang.upper()
-            return True
+        return self.default_language
 
-        return False
+    @classmethod
+    def is_supported(cls, lang: str) -> bool:
+        """Return True if there are replies available in the given language."""
+        return lang.upper() in cls.supported_languages
 
     def reply(self, html_file: str, **kwargs):
         """Return HTML reply in the selected language.
@@ -45,13 +206,37 @@ class HTMLReplies:
             A string containing the formatted html response.
 
         """
-        path = f"templates/{self.language}/{html_file}"
+        start = time.perf_counter()
+        with tracing.span("render", template=html_file, language=self.language):
+            template = get_registry().get(self.language, html_file)
+            html = template.format(**kwargs).rstrip("\n")
+        metrics.record_render(time.perf_counter() - start)
+        _last_rendered[(self.language, html_file)] = (time.monotonic(), html)
+        return html
 
-        # return html in default language in case there's no html template available
-        # for the currently selected language
-        if not os.path.exists(path):
-            path = f"templates/{self.default_lang}/{html_file}"
 
-        with open(path, encoding="utf-8") as f:
-            html = f.read().format(**kwargs).rstrip("\n")
-        return html
+_renderers = {lang: HTMLReplies(lang) for lang in HTMLReplies.supported_languages}
+
+# (language, template) -> (monotonic time, html) of the last render
+_last_rendered: dict[tuple[str, str], tuple[float, str]] = {}
+
+
+def last_rendered(lang: str, html_file: str, max_age: float) -> str | None:
+    """Return the last reply rendered from a template, unless older than `max_age`.
+
+    Only meaningful for templates whose replies are the same for every chat (e.g.
+    network stats), used to answer again without new API calls.
+
+    """
+    rendered_at, html = _last_rendered.get((lang, html_file), (0.0, None))
+    return html if time.monotonic() - rendered_at <= max_age else None
+
+
+def get_replies(lang: str | None = None) -> HTMLReplies:
+    """Return the shared renderer for a language.
+
+    Falls back to the default language if `lang` is empty or not supported.
+
+    """
+    default = _renderers[HTMLReplies.default_language]
+    return _renderers.get((lang or "").upper(), default)
@@ -0,0 +1,275 @@
+"""State shared by the bot workers: caches and leases.
+
+When several workers serve the bot (processes or dynos behind the webhook), they
+share caches (e.g. chat admin ids) and agree on who runs what through leases: the
+end of epoch summary, each broadcast and each pending tip or wallet connection is
+owned by a single worker at a time. A lease expires unless its owner renews it, so
+the work of a worker that died is taken over by another one.
+
+The backend is selected with `SHARED_BACKEND`:
+
+- `memory` (default): process-local, for a single worker (and tests).
+- `sqlite`: a SQLite database shared by the workers of a host (`SHARED_DB_PATH`,
+  default: `CARDABOT_DB_PATH`).
+
+Other backends (e.g. Redis, to share state between hosts) implement `SharedBackend`.
+Workers are identified by `WORKER_ID`, or the dyno name, or host and pid.
+
+"""
+import json
+import os
+import socket
+import threading
+import time
+
+from . import storage
+
+
+class SharedBackend:
+    """Interface of the shared backends."""
+
+    shared = True  # whether other workers see the same state
+
+    def get(self, key: str):
+        """Return the cached value of `key`, or None if missing or expired."""
+        raise NotImplementedError
+
+    def set(self, key: str, value, ttl: float) -> None:
+        """Cache a JSON-serializable value for `ttl` seconds."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Drop a cached value, if present."""
+        raise NotImplementedError
+
+    def pop(self, keys: list[str]) -> list[str]:
+        """Drop the given keys; return those that held an unexpired value."""
+        raise NotImplementedError
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """Take (or renew) the lease `name` for `ttl` seconds.
+
+        Returns False if another owner holds a lease that hasn't expired.
+
+        """
+        raise NotImplementedError
+
+    def renew(self, prefix: str, owner: str, ttl: float) -> int:
+        """Renew every lease of `owner` whose name starts with `prefix`."""
+        raise NotImplementedError
+
+    def release(self, name: str, owner: str) -> None:
+        """Give a lease up, if `owner` holds it."""
+        raise NotImplementedError
+
+    def holder(self, name: str) -> str | None:
+        """Return the owner of the lease `name`, or None if it is free."""
+        raise NotImplementedError
+
+
+class MemoryBackend(SharedBackend):
+    """Process-local backend: every lease is free for the only worker.
+
+    The cache holds up to `maxsize` values; expired ones are dropped when read, or
+    when the cache is full.
+
+    """
+
+    shared = False
+
+    def __init__(self, maxsize: int = 65536) -> None:
+        self.maxsize = maxsize
+        self._cache: dict[str, tuple[float, object]] = {}
+        self._leases: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] <= time.time():
+                del self._cache[key]
+                entry = None
+        return entry[1] if entry else None
+
+    def set(self, key: str, value, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            if key not in self._cache and len(self._cache) >= self.maxsize:
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+                if len(self._cache) >= self.maxsize:
+                    # still full: make room by dropping the value expiring first
+                    del self._cache[min(self._cache, key=lambda k: self._cache[k][0])]
+            self._cache[key] = (now + ttl, value)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def pop(self, keys: list[str]) -> list[str]:
+        now = time.time()
+        with self._lock:
+            entries = {key: self._cache.pop(key, None) for key in keys}
+        return [key for key, entry in entries.items() if entry and entry[0] > now]
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            holder, expires_at = self._leases.get(name, (owner, 0))
+            if holder != owner and expires_at > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+    def renew(self, prefix: str, owner: str, ttl: float) -> int:
+        expires_at = time.time() + ttl
+        with self._lock:
+            names = [
+                name
+                for name, (holder, _) in self._leases.items()
+                if holder == owner and name.startswith(prefix)
+            ]
+            for name in names:
+                self._leases[name] = (owner, expires_at)
+        return len(names)
+
+    def release(self, name: str, owner: str) -> None:
+        with self._lock:
+            if self._leases.get(name, (None,))[0] == owner:
+                del self._leases[name]
+
+    def holder(self, name: str) -> str | None:
+        with self._lock:
+            owner, expires_at = self._leases.get(name, (None, 0))
+        return owner if expires_at > time.time() else None
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shared_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shared_cache_expires_at ON shared_cache (expires_at);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class SQLiteBackend(SharedBackend):
+    """Backend for the workers of a host, in a SQLite database.
+
+    Each lease operation is a single statement, so it is atomic between processes.
+    Expired cache rows are deleted on every write.
+
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        self._conn = storage.connect(path)
+        self._lock = threading.Lock()
+        self._conn.executescript(SCHEMA)
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM shared_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return json.loads(row["value"]) if row else None
+
+    def set(self, key: str, value, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM shared_cache WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO shared_cache (key, value, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM shared_cache WHERE key = ?", (key,))
+
+    def pop(self, keys: list[str]) -> list[str]:
+        popped = []
+        for start in range(0, len(keys), 500):  # below SQLite's variables limit
+            chunk = keys[start : start + 500]
+            marks = ", ".join("?" * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT key FROM shared_cache WHERE key IN ({marks}) "
+                    "AND expires_at > ?",
+                    (*chunk, time.time()),
+                ).fetchall()
+                if rows:
+                    self._conn.execute(
+                        f"DELETE FROM shared_cache WHERE key IN ({marks})", chunk
+                    )
+            popped.extend(row["key"] for row in rows)
+        return popped
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET "
+                "owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                (name, owner, now + ttl, now),
+            )
+        return cursor.rowcount > 0
+
+    def renew(self, prefix: str, owner: str, ttl: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE leases SET expires_at = ? "
+                "WHERE owner = ? AND substr(name, 1, ?) = ?",
+                (time.time() + ttl, owner, len(prefix), prefix),
+            )
+        return cursor.rowcount
+
+    def release(self, name: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner)
+            )
+
+    def holder(self, name: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT owner FROM leases WHERE name = ? AND expires_at > ?",
+                (name, time.time()),
+            ).fetchone()
+        return row["owner"] if row else None
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> SharedBackend:
+    """Return the process-wide backend selected by `SHARED_BACKEND`."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            name = os.environ.get("SHARED_BACKEND", "memory").lower()
+            if name == "memory":
+                _backend = MemoryBackend()
+            elif name == "sqlite":
+                _backend = SQLiteBackend(os.environ.get("SHARED_DB_PATH"))
+            else:
+                raise ValueError(f"Unknown shared backend: {name}")
+        return _backend
+
+
+def worker_id() -> str:
+    """Return the name of this worker, as the owner of its leases."""
+    return (
+        os.environ.get("WORKER_ID")
+        or os.environ.get("DYNO")
+        or f"{socket.gethostname()}:{os.getpid()}"
+    )
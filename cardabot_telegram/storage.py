@@ -0,0 +1,24 @@
+"""Local SQLite storage for state that must survive restarts."""
+import os
+import sqlite3
+
+
+def db_path() -> str:
+    """Return the SQLite database path (`CARDABOT_DB_PATH`)."""
+    return os.environ.get("CARDABOT_DB_PATH", "cardabot.sqlite3")
+
+
+def connect(path: str | None = None) -> sqlite3.Connection:
+    """Open a connection that can be shared between threads.
+
+    Callers are responsible for serializing access to the connection.
+
+    """
+    conn = sqlite3.connect(
+        path or db_path(), check_same_thread=False, isolation_level=None
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
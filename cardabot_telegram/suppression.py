@@ -0,0 +1,93 @@
+"""Persistent index of chats that can't receive messages from the bot."""
+import threading
+import time
+
+from . import storage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS suppressed_chats (
+    chat_id TEXT PRIMARY KEY,
+    reason TEXT,
+    failures INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    next_check REAL NOT NULL
+);
+"""
+
+
+class SuppressionIndex:
+    """Chats that blocked the bot or no longer exist.
+
+    Broadcasts skip suppressed chats until their next check time. After that, the next
+    broadcast tries them again: a successful send removes the chat from the index,
+    while another failure doubles the waiting time (up to `max_backoff`).
+
+    The index is mirrored in memory, so lookups don't touch the database.
+
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        base_backoff: float = 24 * 3600,
+        max_backoff: float = 60 * 24 * 3600,
+    ) -> None:
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._conn = storage.connect(path)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        rows = self._conn.execute(
+            "SELECT chat_id, failures, next_check FROM suppressed_chats"
+        ).fetchall()
+        self._index = {
+            row["chat_id"]: (row["failures"], row["next_check"]) for row in rows
+        }
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def is_suppressed(self, chat_id: int | str) -> bool:
+        """Return True if the chat should be skipped right now."""
+        entry = self._index.get(str(chat_id))
+        return entry is not None and entry[1] > time.time()
+
+    def record_failure(self, chat_id: int | str, reason: str) -> None:
+        """Add a dead chat to the index, or push back its next check."""
+        chat_id, now = str(chat_id), time.time()
+        with self._lock:
+            failures = self._index.get(chat_id, (0, 0))[0] + 1
+            backoff = min(self.base_backoff * 2 ** (failures - 1), self.max_backoff)
+            self._index[chat_id] = (failures, now + backoff)
+            self._conn.execute(
+                "INSERT INTO suppressed_chats "
+                "(chat_id, reason, failures, first_seen, next_check) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (chat_id) DO UPDATE SET "
+                "reason = excluded.reason, failures = excluded.failures, "
+                "next_check = excluded.next_check",
+                (chat_id, reason, failures, now, now + backoff),
+            )
+
+    def clear(self, chat_id: int | str) -> None:
+        """Remove a chat from the index (e.g. after a successful send)."""
+        chat_id = str(chat_id)
+        if chat_id not in self._index:
+            return
+        with self._lock:
+            self._index.pop(chat_id, None)
+            self._conn.execute(
+                "DELETE FROM suppressed_chats WHERE chat_id = ?", (chat_id,)
+            )
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> SuppressionIndex:
+    """Return the process-wide suppression index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SuppressionIndex()
+        return _index
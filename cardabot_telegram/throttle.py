@@ -0,0 +1,231 @@
+"""Rate limits in front of the bot commands.
+
+`Throttle` checks every command before its handler runs (in handler group -1):
+
+- the same command sent again by the same user in the same chat (in reply to the
+  same message, if any) within `THROTTLE_DUPLICATE_WINDOW` seconds (default: 5) is
+  dropped silently;
+- each user and each chat get a token bucket (`THROTTLE_USER_RATE` and
+  `THROTTLE_CHAT_RATE` commands per second, bursts of `THROTTLE_USER_BURST` and
+  `THROTTLE_CHAT_BURST`);
+- at most `THROTTLE_MAX_IN_FLIGHT` commands are handled at once; up to
+  `THROTTLE_MAX_QUEUED` more wait for a free slot.
+
+Commands over a limit don't reach the CardaBot API. Network-wide commands (/epoch,
+/pots, ...) are answered with the last reply rendered for them, if not older than
+`THROTTLE_CACHED_REPLY_AGE` seconds (default: 60); other commands get a pre-rendered
+"slow down" reply. Either is sent at most once per `THROTTLE_NOTICE_INTERVAL`
+seconds per chat (and command, for cached answers).
+
+"""
+import collections
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from cachetools import TTLCache
+from telegram import MessageEntity, Update
+from telegram.ext import DispatcherHandlerStop, TypeHandler
+
+from . import metrics
+from .ratelimit import KeyedTokenBuckets
+from .replies import get_replies, last_rendered
+
+# slots held longer than this (e.g. by an update no handler took) are reclaimed
+SLOT_TIMEOUT = 300
+
+# templates of the commands whose answer is the same in every chat
+CACHED_REPLIES = {
+    "epoch": "epoch_info.html",
+    "pots": "pots.html",
+    "netparams": "netparams.html",
+    "netstats": "netstats.html",
+}
+
+
+class Throttle:
+    """Admission control of the bot commands (see the module docstring).
+
+    `commands` are the names of the bot commands (see `handlers.COMMANDS`); other
+    updates are let through untouched. The optional `language_cache` (a
+    `database.ChatCache`) gives the chat's language for the "slow down" reply when
+    it is known without asking the CardaBot API.
+
+    """
+
+    def __init__(self, commands, language_cache=None) -> None:
+        env = os.environ.get
+        self.commands = frozenset(command.lower() for command in commands)
+        self.language_cache = language_cache
+        self.max_in_flight = int(env("THROTTLE_MAX_IN_FLIGHT", 32))
+        self.max_queued = int(env("THROTTLE_MAX_QUEUED", 64))
+        self.cached_reply_age = float(env("THROTTLE_CACHED_REPLY_AGE", 60))
+        self.users = KeyedTokenBuckets(
+            float(env("THROTTLE_USER_RATE", 0.2)),
+            float(env("THROTTLE_USER_BURST", 3)),
+        )
+        self.chats = KeyedTokenBuckets(
+            float(env("THROTTLE_CHAT_RATE", 0.5)),
+            float(env("THROTTLE_CHAT_BURST", 6)),
+        )
+        self._recent = TTLCache(
+            maxsize=65536, ttl=float(env("THROTTLE_DUPLICATE_WINDOW", 5))
+        )
+        self._noticed = TTLCache(
+            maxsize=65536, ttl=float(env("THROTTLE_NOTICE_INTERVAL", 30))
+        )
+        self._notices: dict[str, str] = {}  # language -> rendered reply
+        self._admitted: dict[int, float] = {}  # update id -> when its slot was taken
+        self._queued: collections.deque[Update] = collections.deque()
+        self._dispatcher = None
+        self._lock = threading.Lock()
+
+    def install(self, dispatcher) -> None:
+        """Check updates before the command handlers (which are in group 0)."""
+        self._dispatcher = dispatcher
+        dispatcher.add_handler(TypeHandler(Update, self.check), group=-1)
+
+    def wrap(self, command: str, callback):
+        """Wrap a command callback to free its slot when done (see `handlers`)."""
+
+        def throttled(update, context):
+            try:
+                result = callback(update, context)
+            except BaseException:
+                self.done(update)
+                raise
+
+            if isinstance(result, Future):  # async mode: wait for the coroutine
+                result.add_done_callback(lambda _: self.done(update))
+            else:
+                self.done(update)
+            return result
+
+        return throttled
+
+    def _command(self, update: Update, bot) -> str | None:
+        """Return the command of the update if one of our handlers will take it.
+
+        Same matching as `telegram.ext.CommandHandler`.
+
+        """
+        message = update.message or update.edited_message
+        if message is None or not message.text or not message.entities:
+            return None
+        entity = message.entities[0]
+        if entity.type != MessageEntity.BOT_COMMAND or entity.offset != 0:
+            return None
+
+        command, _, username = message.text[1 : entity.length].partition("@")
+        if username and username.lower() != bot.username.lower():
+            return None
+        return command.lower() if command.lower() in self.commands else None
+
+    def check(self, update: Update, context) -> None:
+        """Let the update through, or stop it (`DispatcherHandlerStop`)."""
+        with self._lock:
+            if update.update_id in self._admitted:
+                return  # a queued command, taking the slot freed for it
+        command = self._command(update, context.bot)
+        if command is None:
+            return
+
+        message = update.effective_message
+        chat_id = update.effective_chat.id
+        user_id = update.effective_user.id if update.effective_user else chat_id
+        # commands replying to a message (e.g. /tip) are only duplicates when they
+        # reply to the same one
+        reply_to = message.reply_to_message
+        text = " ".join(message.text.lower().split())
+        key = (chat_id, user_id, text, reply_to.message_id if reply_to else None)
+        with self._lock:
+            duplicate = key in self._recent
+            self._recent[key] = True
+        if duplicate:
+            self._reject(update, "duplicate", command, notify=False)
+        # take a token from each bucket only if both have one
+        user_bucket, chat_bucket = self.users[user_id], self.chats[chat_id]
+        if not user_bucket.available():
+            self._reject(update, "user", command)
+        if not chat_bucket.available():
+            self._reject(update, "chat", command)
+        user_bucket.try_acquire()
+        chat_bucket.try_acquire()
+
+        with self._lock:
+            now = time.monotonic()
+            if len(self._admitted) >= self.max_in_flight:
+                self._reclaim(now)
+            if len(self._admitted) < self.max_in_flight:
+                self._admitted[update.update_id] = now
+                return
+            queued = len(self._queued) < self.max_queued
+            if queued:
+                self._queued.append(update)
+        if queued:
+            raise DispatcherHandlerStop()  # put back by `done` when a slot is free
+        self._reject(update, "busy", command)
+
+    def done(self, update: Update) -> None:
+        """Free the slot of a command, handing it to the next queued one."""
+        with self._lock:
+            if self._admitted.pop(update.update_id, None) is None:
+                return
+            if not self._queued:
+                return
+            update = self._queued.popleft()
+            self._admitted[update.update_id] = time.monotonic()
+        self._dispatcher.update_queue.put(update)
+
+    def _reclaim(self, now: float) -> None:
+        """Drop stale slots. Call with the lock held."""
+        stale = [
+            update_id
+            for update_id, since in self._admitted.items()
+            if now - since > SLOT_TIMEOUT
+        ]
+        for update_id in stale:
+            logging.warning("Reclaiming the throttle slot of update %s", update_id)
+            del self._admitted[update_id]
+
+    def _reject(
+        self, update: Update, reason: str, command: str, notify: bool = True
+    ) -> None:
+        """Count the rejection, answer the chat (at most once) and stop the update.
+
+        The answer is the cached reply of the command, if any, or a "slow down" one.
+
+        """
+        metrics.THROTTLED.inc(reason)
+        if not notify:
+            raise DispatcherHandlerStop()
+
+        chat_id = update.effective_chat.id
+        language = self._language(chat_id)
+        text = None
+        if command in CACHED_REPLIES:
+            text = last_rendered(
+                language, CACHED_REPLIES[command], self.cached_reply_age
+            )
+        key = (chat_id, command if text else None)
+        with self._lock:
+            notify = key not in self._noticed
+            if notify:
+                self._noticed[key] = True
+        if notify:
+            # sent from the worker pool: the dispatcher thread only takes decisions
+            self._dispatcher.run_async(
+                update.effective_message.reply_html, text or self._notice(language)
+            )
+        raise DispatcherHandlerStop()
+
+    def _language(self, chat_id: int) -> str:
+        chat = self.language_cache.get(chat_id) if self.language_cache else None
+        return get_replies((chat or {}).get("default_language")).language
+
+    def _notice(self, language: str) -> str:
+        if language not in self._notices:
+            self._notices[language] = get_replies(language).reply("rate_limited.html")
+        return self._notices[language]
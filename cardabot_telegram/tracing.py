@@ -0,0 +1,167 @@
+"""Lightweight request tracing, emitted as structured JSON logs.
+
+A trace follows one unit of work: a Telegram update (`update:<update_id>`) or a
+scheduler job (`job:<name>:<timestamp>`). It is kept in a context variable, so it
+propagates to the API calls, Telegram requests and template renders made on its
+behalf, including calls fanned out with `api.gather` and coroutines run in async
+mode. Watches (e.g. of a tip) keep the trace of the command that created them.
+
+Each finished span is logged as one JSON object on the `cardabot_telegram.trace`
+logger:
+
+    {"trace_id": "update:42", "span_id": "9f1c...", "parent_id": "...",
+     "name": "api", "start": 1650000000.123, "duration_ms": 51.2,
+     "attrs": {"method": "GET", "endpoint": "epoch/", "status": 200}}
+
+Traces are sampled when they start, at `TRACE_SAMPLE_RATE` (0 to 1, default 0.01);
+spans of unsampled traces cost a context variable lookup.
+
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import random
+import secrets
+import sys
+import time
+from collections.abc import Iterator
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+logger = logging.getLogger("cardabot_telegram.trace")
+
+
+@dataclass(frozen=True)
+class Trace:
+    trace_id: str
+    sampled: bool
+    parent_id: str | None = None  # span the next span is nested into
+
+
+class Span:
+    """A timed operation of a sampled trace."""
+
+    def __init__(self, trace: Trace, name: str, attrs: dict) -> None:
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.span_id = secrets.token_hex(8)
+        self.start = time.time()
+        self._start = time.perf_counter()
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def finish(self, error: BaseException | None = None) -> None:
+        record = {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.trace.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round(1000 * (time.perf_counter() - self._start), 3),
+            "attrs": self.attrs,
+        }
+        if error is not None:
+            record["error"] = repr(error)
+        logger.info(json.dumps(record, default=str))
+
+
+class _NoopSpan:
+    def set(self, **attrs) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+
+
+def sample_rate() -> float:
+    return float(os.environ.get("TRACE_SAMPLE_RATE", 0.01))
+
+
+def current() -> Trace | None:
+    """Return the trace of the current context (to resume it elsewhere)."""
+    return _trace.get()
+
+
+@contextlib.contextmanager
+def _run_span(trace: Trace, name: str, attrs: dict) -> Iterator[Span | _NoopSpan]:
+    if not trace.sampled:
+        token = _trace.set(trace)  # keep nested traces unsampled too
+        try:
+            yield NOOP_SPAN
+        finally:
+            _trace.reset(token)
+        return
+
+    span = Span(trace, name, attrs)
+    token = _trace.set(Trace(trace.trace_id, True, span.span_id))
+    try:
+        yield span
+    except BaseException as e:
+        span.finish(error=e)
+        raise
+    else:
+        span.finish()
+    finally:
+        _trace.reset(token)
+
+
+def trace(name: str, trace_id: str | None = None, **attrs):
+    """Start a trace, with `name` as its root span (context manager).
+
+    Inside an existing trace, this is just a nested span.
+
+    """
+    parent = _trace.get()
+    if parent is not None:
+        return _run_span(parent, name, attrs)
+
+    new = Trace(trace_id or secrets.token_hex(8), random.random() < sample_rate())
+    return _run_span(new, name, attrs)
+
+
+def span(name: str, **attrs):
+    """Time an operation of the current trace, if any (context manager).
+
+    Yields an object whose `set(**attrs)` adds attributes to the span.
+
+    """
+    parent = _trace.get()
+    if parent is None or not parent.sampled:
+        return contextlib.nullcontext(NOOP_SPAN)
+    return _run_span(parent, name, attrs)
+
+
+def resume(parent: Trace | None, name: str, **attrs):
+    """Continue `parent` (see `current`) with a new span, e.g. from another thread."""
+    if parent is None or not parent.sampled:
+        return contextlib.nullcontext(NOOP_SPAN)
+    return _run_span(parent, name, attrs)
+
+
+def job(name: str):
+    """Decorator running a scheduler job in a trace of its own."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace(name, trace_id=f"job:{name}:{int(time.time())}"):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def setup(stream=None) -> None:
+    """Write spans as bare JSON lines, one per span (stderr by default)."""
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
@@ -1,32 +1,59 @@
+import functools
 import glob
 import logging
 import os
-import subprocess
+import threading
 from collections import OrderedDict
 from datetime import timedelta
 
-import requests
 from apscheduler.schedulers.background import BackgroundScheduler
-from cachetools import TTLCache, cached
-from telegram.error import BadRequest
+from . import bech32, broadcast, shared, suppression
 
-from . import database
+_scheduler = None
+_scheduler_lock = threading.Lock()
 
-cardabot_db = database.CardabotDB(url=os.environ.get("CARDABOT_API_URL"))
 
+def get_scheduler() -> BackgroundScheduler:
+    """Return the process-wide background scheduler, started on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            # runs missed while busy or down are merged into one, if not too late
+            _scheduler = BackgroundScheduler(
+                job_defaults={"coalesce": True, "misfire_grace_time": 30}
+            )
+            _scheduler.start()
+        return _scheduler
 
-class Scheduler:
-    queue = BackgroundScheduler()
-    queue.start()  # start scheduler
 
+@functools.lru_cache(maxsize=4096)
+def bech32_to_hex(pool_bech32: str) -> str:
+    """Return the hex payload of a bech32 string, such as a pool id.
 
-def bech32_to_hex(pool_bech32):
-    cwd = os.getcwd()
-    cmd = "{}/bin/bech32 <<< {}".format(cwd, pool_bech32)
-    process = subprocess.run(
-        cmd, shell=True, executable="/bin/bash", capture_output=True
-    )
-    return process.stdout.strip().decode()
+    Results are memoized. Raises `bech32.Bech32Error` if the string is invalid.
+
+    """
+    _, data = bech32.decode(pool_bech32.strip())
+    return data.hex()
+
+
+@functools.lru_cache(maxsize=4096)
+def hex_to_bech32(hrp: str, value: str) -> str:
+    """Return the bech32 encoding of a hex string (memoized)."""
+    return bech32.encode(hrp, bytes.fromhex(value.strip()))
+
+
+def is_malformed_pool_id(value: str) -> bool:
+    """Check if value looks like a bech32 pool id but is not a valid one.
+
+    Pool tickers are not checked, they can only be resolved by the CardaBot API.
+
+    """
+    if len(value) <= len(bech32.POOL_HRP) + 1:  # too short, probably a ticker
+        return False
+    if not value.lower().startswith(bech32.POOL_HRP + "1"):
+        return False
+    return not bech32.is_pool_id(value)
 
 
 def calc_pool_saturation(pool_stake: int, circ_supply: int, n_opt: int) -> float:
@@ -112,14 +139,18 @@ def fmt_ada(value: float) -> str:
     return f"{float(value):.0f}"
 
 
-@cached(cache=TTLCache(maxsize=2048, ttl=3600))
 def get_admin_ids(bot, chat_id: int) -> list[int]:
     """Return a list of admin IDs for a given chat.
 
-    Results are cached for 1 hour.
+    Results are cached for 1 hour, in the backend shared by the workers.
 
     """
-    return [admin.user.id for admin in bot.get_chat_administrators(chat_id)]
+    cache = shared.get_backend()
+    admin_ids = cache.get(f"admin_ids:{chat_id}")
+    if admin_ids is None:
+        admin_ids = [admin.user.id for admin in bot.get_chat_administrators(chat_id)]
+        cache.set(f"admin_ids:{chat_id}", admin_ids, ttl=3600)
+    return admin_ids
 
 
 def user_is_adm(update, context):
@@ -132,35 +163,27 @@ def user_is_adm(update, context):
 def send_to_all(bot, chat_ids: list[str], text: str, parse_mode="Markdown"):
     """Send a message to several chats.
 
-    Ignore invalid chat IDs.
+    Ignore invalid chat IDs and skip chats known to be unreachable (see the
+    `suppression` module). Messages are sent concurrently within the Telegram rate
+    limits; set `BROADCAST_DRY_RUN` to simulate the sends with a fake bot.
 
     Args:
         bot: Telegram bot instance.
         chat_ids: List of chat IDs.
         text: Message text.
 
-    """
-    for chat_id in chat_ids:
-        try:
-            print("try to send to ", chat_id)
-            bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
-        except BadRequest as e:
-            logging.debug(f"Invalid chat_id: {chat_id} ({repr(e)})")
-
+    Returns:
+        A `broadcast.BroadcastReport` with the delivery totals.
 
-def get_epoch_duration() -> int:
-    """Return epoch length in seconds."""
-    return 432000
-
-
-def get_epoch_remaning_time() -> int:
-    """Return epoch remaning time in seconds."""
-    res = requests.get(
-        os.path.join(cardabot_db.base_url, "epoch/"), headers=cardabot_db.headers
+    """
+    broadcaster = broadcast.Broadcaster(
+        bot,
+        dry_run=broadcast.dry_run_enabled(),
+        suppression=suppression.get_index(),
     )
-    res.raise_for_status()
-
-    return int(res.json().get("data").get("remaining_time"))
+    report = broadcaster.send(chat_ids, text, parse_mode=parse_mode)
+    logging.info("Broadcast finished: %s", report)
+    return report
 
 
 def isnumber(s: str) -> bool:
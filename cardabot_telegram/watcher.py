@@ -0,0 +1,375 @@
+"""Shared poller for pending wallet connections and transactions."""
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from . import profiling, shared, storage, tracing, utils
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_watches (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    deadline REAL NOT NULL,
+    interval REAL NOT NULL,
+    max_interval REAL NOT NULL
+);
+"""
+
+# (check, on_expire) of a watch, rebuilt from its kind and params
+WatchFactory = Callable[[dict], tuple[Callable[[], bool], Callable[[], None]]]
+
+
+@dataclass
+class Watch:
+    """Something waiting on the CardaBot API, e.g. a tx to be submitted.
+
+    `check` is called on every poll and returns True once the watch is done (it is
+    responsible for notifying the user). If it is still pending after `deadline`,
+    `on_expire` is called instead and the watch is dropped.
+
+    """
+
+    key: str
+    check: Callable[[], bool]
+    on_expire: Callable[[], None]
+    deadline: float
+    interval: float
+    max_interval: float
+    backoff: float = 1.5
+    next_check: float = 0.0
+    checks: int = field(default=0, compare=False)
+    trace: tracing.Trace | None = None  # of the command that started the watch
+    kind: str | None = None  # persisted watches only, see `Watcher.resume`
+    params: dict | None = None
+
+
+class WatchStore:
+    """SQLite store of the pending watches, to resume them after a restart."""
+
+    def __init__(self, path: str | None = None) -> None:
+        self._conn = storage.connect(path)
+        self._lock = threading.Lock()
+        self._conn.executescript(SCHEMA)
+
+    def save(self, watch: Watch) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pending_watches "
+                "(key, kind, params, deadline, interval, max_interval) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    watch.key,
+                    watch.kind,
+                    json.dumps(watch.params),
+                    watch.deadline,
+                    watch.interval,
+                    watch.max_interval,
+                ),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM pending_watches WHERE key = ?", (key,))
+
+    def load(self) -> list[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute("SELECT * FROM pending_watches").fetchall()
+
+
+class Watcher:
+    """Poll every pending watch from a single scheduler job.
+
+    Watches are kept in a heap ordered by their next check time. On each tick, the
+    due ones are checked concurrently on a bounded thread pool. The polling interval
+    of each watch grows by `backoff` after every negative check, up to its
+    `max_interval`.
+
+    Watches added with a `kind` are also saved in `store`, so `resume` can restore
+    them after a restart. With several workers, each persisted watch is owned by the
+    worker holding its lease (`watch:<key>` in the shared backend), renewed on every
+    tick; the watches of a worker that stopped renewing them are adopted by another.
+
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        store: WatchStore | None = None,
+        backend: shared.SharedBackend | None = None,
+    ) -> None:
+        self.store = store
+        self.backend = backend or shared.get_backend()
+        self.owner = shared.worker_id()
+        self.lease_ttl = float(os.environ.get("WATCH_LEASE_TTL", 60))
+        self._leases_renewed = time.monotonic()
+        self._factories: dict[str, WatchFactory] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._watches: dict[str, Watch] = {}
+        self._running: set[str] = set()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers or int(os.environ.get("WATCHER_WORKERS", 8)),
+            thread_name_prefix="watcher",
+        )
+
+    def __len__(self) -> int:
+        return len(self._watches)
+
+    def _push(self, watch: Watch) -> None:
+        heapq.heappush(self._heap, (watch.next_check, next(self._seq), watch.key))
+
+    def add(
+        self,
+        key: str,
+        check: Callable[[], bool],
+        on_expire: Callable[[], None],
+        timeout: float,
+        first_check: float = 5,
+        interval: float = 5,
+        max_interval: float = 30,
+        kind: str | None = None,
+        params: dict | None = None,
+    ) -> Watch:
+        """Start watching; `key` identifies the watch and replaces any previous one.
+
+        Args:
+            key: unique id of the watch (e.g. "tx:<tx_id>").
+            check: returns True once the watch is done.
+            on_expire: called if the watch isn't done after `timeout` seconds.
+            timeout: seconds until the watch expires.
+            first_check: seconds until the first check.
+            interval: initial seconds between checks.
+            max_interval: upper bound for the seconds between checks.
+            kind: persist the watch, to be rebuilt by the `kind` factory on resume.
+            params: JSON-serializable arguments of the factory (ids, not objects).
+
+        """
+        now = time.time()
+        watch = Watch(
+            key=key,
+            check=check,
+            on_expire=on_expire,
+            deadline=now + timeout,
+            interval=interval,
+            max_interval=max_interval,
+            next_check=now + first_check,
+            trace=tracing.current(),
+            kind=kind,
+            params=params,
+        )
+        with self._lock:
+            # saved under the lock, so a finishing watch of the same key can't
+            # delete the row of its replacement
+            if kind is not None and self.store is not None:
+                self.store.save(watch)
+                self.backend.acquire(f"watch:{key}", self.owner, self.lease_ttl)
+            self._watches[key] = watch
+            self._push(watch)
+        return watch
+
+    def cancel(self, key: str) -> Watch | None:
+        """Stop watching, returning the removed watch (if any)."""
+        with self._lock:
+            watch = self._watches.pop(key, None)
+            self._forget(watch)
+        return watch
+
+    def _forget(self, watch: Watch | None) -> None:
+        """Delete a finished watch from the store (called with the lock held)."""
+        if watch is not None and watch.kind is not None and self.store is not None:
+            self.store.delete(watch.key)
+            self.backend.release(f"watch:{watch.key}", self.owner)
+
+    def resume(
+        self, factories: dict[str, WatchFactory], jitter: float | None = None
+    ) -> int:
+        """Restore the persisted watches, e.g. on startup.
+
+        Only watches without a live owner are restored, and this worker takes their
+        leases. With a shared backend, this is repeated on every lease renewal, to
+        adopt the watches of workers that stopped.
+
+        The first checks are spread over `jitter` seconds (`WATCH_RESUME_JITTER`,
+        default: 30), so a restart doesn't check every overdue watch at once. Watches
+        that expired meanwhile get one last check before expiring.
+
+        Args:
+            factories: kind -> function returning the (check, on_expire) callbacks of
+                a watch from its params.
+            jitter: seconds over which the first checks are spread.
+
+        Returns:
+            The number of resumed watches.
+
+        """
+        if self.store is None:
+            return 0
+        if jitter is None:
+            jitter = float(os.environ.get("WATCH_RESUME_JITTER", 30))
+        self._factories = factories
+
+        now = time.time()
+        watches = []
+        for row in self.store.load():
+            if row["key"] in self._watches:
+                continue
+            lease = f"watch:{row['key']}"
+            if not self.backend.acquire(lease, self.owner, self.lease_ttl):
+                continue  # watched by another worker
+
+            factory = factories.get(row["kind"])
+            if factory is None:
+                logging.warning("Dropping watch %s of unknown kind", row["key"])
+                self.store.delete(row["key"])
+                continue
+
+            params = json.loads(row["params"])
+            check, on_expire = factory(params)
+            next_check = now + random.uniform(0, jitter)
+            watches.append(
+                Watch(
+                    key=row["key"],
+                    check=check,
+                    on_expire=on_expire,
+                    deadline=max(row["deadline"], next_check),
+                    interval=row["interval"],
+                    max_interval=row["max_interval"],
+                    next_check=next_check,
+                    kind=row["kind"],
+                    params=params,
+                )
+            )
+
+        with self._lock:
+            for watch in watches:
+                self._watches.setdefault(watch.key, watch)
+            self._heap.extend(
+                (watch.next_check, next(self._seq), watch.key) for watch in watches
+            )
+            heapq.heapify(self._heap)
+        return len(watches)
+
+    def trigger(self, key: str) -> bool:
+        """Check a watch right away (e.g. when the API notifies us of a change).
+
+        A watch owned by another worker is checked by that worker on its next tick:
+        the trigger is left for it in the shared backend (`trigger:<key>`).
+
+        Returns False if no worker has a pending watch with the given key.
+
+        """
+        with self._lock:
+            watch = self._watches.get(key)
+            if watch is not None and key not in self._running:
+                self._running.add(key)
+                self._pool.submit(self._run, watch)
+        if watch is not None:
+            return True
+
+        holder = self.backend.holder(f"watch:{key}") if self.backend.shared else None
+        if holder not in (None, self.owner):
+            self.backend.set(f"trigger:{key}", True, self.lease_ttl)
+            return True
+        return False
+
+    def _due(self, now: float) -> list[Watch]:
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                next_check, _, key = heapq.heappop(self._heap)
+                watch = self._watches.get(key)
+                # skip cancelled, replaced or currently running watches
+                if watch is None or watch.next_check != next_check:
+                    continue
+                if key in self._running:
+                    continue
+                self._running.add(key)
+                due.append(watch)
+        return due
+
+    def _run(self, watch: Watch) -> None:
+        expired = False  # on_expire was called
+        try:
+            watch.checks += 1
+            attrs = {"key": watch.key, "check": watch.checks}
+            profile = profiling.profile("watch.check", command=False)
+            with tracing.resume(watch.trace, "watch.check", **attrs) as span, profile:
+                done = watch.check()
+                if not done and time.time() >= watch.deadline:
+                    expired = True
+                    watch.on_expire()
+                    done = True
+                span.set(done=done)
+        except Exception as e:
+            logging.exception(e)
+            done = time.time() >= watch.deadline
+            if done and not expired:
+                # the last check failed: still tell the user the watch is over
+                try:
+                    watch.on_expire()
+                except Exception as e:
+                    logging.exception(e)
+
+        with self._lock:
+            self._running.discard(watch.key)
+            if self._watches.get(watch.key) is not watch:
+                return  # cancelled or replaced while running
+            if done:
+                del self._watches[watch.key]
+                self._forget(watch)
+                return
+
+            watch.interval = min(watch.interval * watch.backoff, watch.max_interval)
+            watch.next_check = min(time.time() + watch.interval, watch.deadline)
+            self._push(watch)
+
+    def tick(self) -> None:
+        """Check every watch that is due (called periodically by the scheduler)."""
+        for watch in self._due(time.time()):
+            self._pool.submit(self._run, watch)
+
+        if self.backend.shared and self._watches:
+            # triggers received by other workers for the watches of this one
+            keys = [f"trigger:{key}" for key in list(self._watches)]
+            for key in self.backend.pop(keys):
+                self.trigger(key[len("trigger:") :])
+
+        if time.monotonic() - self._leases_renewed >= self.lease_ttl / 3:
+            self._leases_renewed = time.monotonic()
+            self.backend.renew("watch:", self.owner, self.lease_ttl)
+            if self.backend.shared and self._factories:
+                if adopted := self.resume(self._factories):
+                    logging.info("Adopted %s watches of a stopped worker", adopted)
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def get_watcher() -> Watcher:
+    """Return the process-wide watcher, scheduling its tick job on first use."""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = Watcher(store=WatchStore())
+            utils.get_scheduler().add_job(
+                _watcher.tick,
+                "interval",
+                seconds=1,
+                id="watcher_tick",
+                max_instances=1,
+                coalesce=True,
+                replace_existing=True,
+            )
+        return _watcher
@@ -0,0 +1,73 @@
+"""API calls made while watching a wallet connection (/connect)."""
+import pytest
+
+from benchmarks.fakes import STAKE_KEY, FakeAPI
+from cardabot_telegram import connection
+
+CHAT_ROUTE = r"GET chats/(-?\d+)/"
+USER_ROUTE = r"GET users/(\d+)/"
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """Fake CardaBot API whose chat is linked to a user once `linked` is set."""
+    fake = FakeAPI(latency=0)
+    fake.linked = False
+    fake.routes.insert(
+        0,
+        (
+            "GET",
+            r"chats/(-?\d+)/",
+            200,
+            lambda m: {"chat_id": m.group(1), "cardabot_user_id": fake.linked or None},
+        ),
+    )
+    fake.start()
+    monkeypatch.setenv("CARDABOT_API_URL", fake.url)
+    monkeypatch.setenv("CARDABOT_API_TOKEN", "test")
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def tracker(fake_api):
+    from cardabot_telegram.callbacks import CardaBotCallbacks
+
+    cbs = CardaBotCallbacks()
+    notified = []
+    tracker = connection.ConnectionTracker(
+        42,
+        get_user_id=cbs._get_cardabot_user_id,
+        get_address=cbs._get_cardabot_user_address,
+        on_connected=notified.append,
+    )
+    tracker.notified = notified
+    return tracker
+
+
+def test_one_call_per_check_while_waiting(fake_api, tracker):
+    for _ in range(3):
+        assert tracker.check() is False
+
+    assert fake_api.calls[CHAT_ROUTE] == 3
+    assert fake_api.calls[USER_ROUTE] == 0
+    assert tracker.state is connection.ConnectionState.WAITING
+
+
+def test_calls_per_successful_connect(fake_api, tracker):
+    attempts = connection.metrics.attempts
+    successes = connection.metrics.successes
+
+    assert tracker.check() is False  # waiting
+    fake_api.linked = 1
+    assert tracker.check() is True  # linked: stake address, then notified
+
+    assert fake_api.calls == {CHAT_ROUTE: 2, USER_ROUTE: 1}
+    assert tracker.api_calls == 3
+    assert tracker.notified == [STAKE_KEY]
+    assert connection.metrics.successes == successes + 1
+    # attempts are counted by /connect, not when a tracker is (re)built
+    assert connection.metrics.attempts == attempts
+
+    assert tracker.check() is True  # done: no more calls
+    assert sum(fake_api.calls.values()) == 3